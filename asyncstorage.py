@@ -0,0 +1,134 @@
+import asyncio
+import concurrent.futures
+import functools
+from typing import Any, AsyncGenerator, Callable, Iterable
+
+import config
+import webstorage
+
+
+class AsyncQuery(webstorage.Query):
+    """
+    Query resolving an asyncio future on its event loop rather than waking a
+    blocked thread
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, function: Callable,
+                 *args, durable: bool = False, **kwargs):
+        super().__init__(function, *args, durable=durable, **kwargs)
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+
+    @staticmethod
+    def get_logging_stack() -> list[Any]:
+        # the stack of a coroutine only leads back to the event loop
+        return ["async query"]
+
+    def set_result(self, value: Any,
+                   exception: Exception | None = None) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.resolve, value, exception)
+        except RuntimeError:
+            # the loop closed whilst the query was queued so nothing is
+            # awaiting it, raising would stop the database command thread
+            pass
+
+    def resolve(self, value: Any, exception: Exception | None) -> None:
+        if self.future.done():  # cancelled whilst queued
+            return
+        if exception is not None:
+            self.future.set_exception(exception)
+        else:
+            self.future.set_result(value)
+
+
+class AsyncDatabase:
+    """
+    asyncio facade over a threaded Database. Writes are queued to the same
+    single command thread and awaited as futures so no thread is blocked per
+    caller, SELECTs run on the read connection pool through an executor so
+    with group commit they only see writes once commit has been awaited
+    """
+    def __init__(self, database: webstorage.Database):
+        assert config.Config.THREADED_SERVER_HANDLING.value, \
+            "AsyncDatabase needs threaded server handling enabled"
+        self.db = database
+        self.read_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, config.Config.READ_CONNECTIONS.value or 0),
+            thread_name_prefix="async_reads")
+
+    def submit(self, function: Callable, *args, durable: bool = False,
+               **kwargs) -> asyncio.Future:
+        """
+        Queue a function to be run on the database command thread
+        :param function: Database method to run
+        :param durable: only resolve once the write has been committed
+        :return: future resolved with the value returned by the function
+        """
+        query = AsyncQuery(asyncio.get_running_loop(), function, *args,
+                           durable=durable, **kwargs)
+        self.db.command_queue.put(query)
+        return query.future
+
+    async def execute(self, script: str, params=None,
+                      is_file=False) -> list[dict[str, Any]]:
+        if self.db.read_pool is not None:
+            sql_script = self.db.get_script(script) if is_file else script
+            if webstorage.is_read_query(sql_script):
+                # execute checks the statement on a read connection and
+                # sends writes starting with WITH to the command thread, so
+                # it runs on the executor rather than the event loop
+                return await asyncio.get_running_loop().run_in_executor(
+                    self.read_executor, functools.partial(
+                        self.db.execute, script, params=params,
+                        is_file=is_file))
+
+        return await self.submit(self.db.execute, script, params=params,
+                                 is_file=is_file)
+
+    async def execute_many(self, script: str,
+                           params: Iterable[Iterable[str]] |
+                                   Iterable[dict[str, str]] |
+                                   None = None) -> list[dict[str, Any]]:
+        # generators would otherwise be consumed on the command thread
+        if params is not None:
+            params = list(params)
+        return await self.submit(self.db.execute_many, script, params=params)
+
+    async def execute_script(self, script: str,
+                             params: dict[str, str] | Iterable[str] | None = None) -> None:
+        return await self.submit(self.db.execute_script, script, params=params)
+
+    async def transaction(self, function: Callable, *args, **kwargs) -> Any:
+        return await self.submit(self.db.transaction, function, *args,
+                                 durable=True, **kwargs)
+
+    async def commit(self) -> None:
+        return await self.submit(self.db.commit, durable=True)
+
+    async def iterate(self, script: str, params=None, is_file=False,
+                      batch_size: int | None = None,
+                      row_factory: str = "tuple") -> AsyncGenerator[Any, None]:
+        """
+        Stream the rows of a query, each batch is one awaited round trip to
+        the command thread
+        """
+        if batch_size is None:
+            batch_size = config.Config.ITERATE_BATCH_SIZE.value
+        if params is None:
+            params = ()
+
+        sql_script = self.db.get_script(script) if is_file else script
+        cursor = await self.submit(self.db.open_cursor, sql_script, params,
+                                   webstorage.ROW_FACTORIES[row_factory])
+        try:
+            while rows := await self.submit(self.db.fetch_batch, cursor,
+                                            batch_size):
+                for row in rows:
+                    yield row
+        finally:
+            # not awaited so closing still works if the generator is collected
+            self.db.command_queue.put(
+                webstorage.Query(self.db.close_cursor, cursor))
+
+    def close(self) -> None:
+        self.read_executor.shutdown(wait=False)
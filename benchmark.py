@@ -0,0 +1,216 @@
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+import config
+import contentstore
+import pagehandler
+import tokens
+import webstorage
+import websearch
+from invertedindex import InvertedIndex
+
+
+def sample_queries(db: webstorage.Database | webstorage.ShardedDatabase,
+                   query_count: int, max_words: int = 3) -> list[str]:
+    """
+    Build queries from random stored tokens so every query has results
+    :param db: database to read tokens from
+    :param query_count: number of queries
+    :param max_words: most words in a query
+    :return: queries
+    """
+    words = [row["text"] for row in db.execute(
+        "SELECT text FROM Token WHERE document_frequency > 0 "
+        "ORDER BY RANDOM() LIMIT 1000")]
+    if not words:
+        return []
+    return [" ".join(random.choices(words, k=random.randint(1, max_words)))
+            for _ in range(query_count)]
+
+
+def time_backend(search: Callable[[str], list], queries: list[str]) -> dict[str, float]:
+    """
+    Run every query once to warm caches then time a second run of each
+    :param search: function answering a single query
+    :param queries: queries to run
+    :return: timings in milliseconds
+    """
+    for query in queries:
+        search(query)
+
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return summarise(times)
+
+
+def summarise(times: list[float]) -> dict[str, float]:
+    times = sorted(times)
+    return {"mean": statistics.fmean(times),
+            "p50": times[len(times) // 2],
+            "p95": times[int(len(times) * 0.95)],
+            "max": times[-1]}
+
+
+def fts_available(db: webstorage.Database | webstorage.ShardedDatabase) -> bool:
+    # scores of different shards cannot be compared
+    if isinstance(db, webstorage.ShardedDatabase):
+        return False
+    return bool(db.execute(
+        "SELECT name FROM sqlite_master WHERE name = 'PageText'"))
+
+
+# run in a fresh interpreter, prints the time each startup stage took
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import webstorage, websearch
+imported = time.perf_counter()
+websearch.set_db(webstorage.open_database())
+opened = time.perf_counter()
+websearch.search_for("search")
+queried = time.perf_counter()
+print(json.dumps({"import": (imported - start) * 1000,
+                  "open database": (opened - imported) * 1000,
+                  "first query": (queried - opened) * 1000,
+                  "total": (queried - start) * 1000}))
+"""
+
+
+def startup_benchmark(runs: int = 10) -> None:
+    """
+    Time to first query of websearch in new processes, the cost every
+    short lived tool pays before it can answer anything
+    :param runs: processes to start
+    :return:
+    """
+    stages: dict[str, list[float]] = dict()
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT],
+                                capture_output=True, text=True, check=True).stdout
+        elapsed = (time.perf_counter() - start) * 1000
+        # logging may come first, the timings are always the last line
+        timings = json.loads(output.strip().splitlines()[-1])
+        timings["process"] = elapsed
+        for stage, milliseconds in timings.items():
+            stages.setdefault(stage, []).append(milliseconds)
+
+    print(f"{runs} cold starts")
+    print(f"{'stage':<18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for stage, times in stages.items():
+        timings = summarise(times)
+        print(f"{stage:<18}" + "".join(f"{timings[column]:>10.3f}"
+                                       for column in ("mean", "p50", "p95", "max")))
+
+
+def extract_benchmark(page_count: int = 100) -> None:
+    """
+    Compare the html extractors on stored pages, checking both give the
+    same text, tokens and links. Needs store page html to be set while
+    crawling
+    :param page_count: most pages to parse
+    :return:
+    """
+    db = webstorage.open_database()
+    pages = [(row["domain"], contentstore.decompress(row["html"], row["compression"]))
+             for row in db.execute(config.Config.GET_HTML_OF_PAGES.value,
+                                   (page_count,), is_file=True)]
+    if not pages:
+        print("No html stored, crawl with store page html enabled first")
+        return
+
+    extractors: dict[str, Callable[[bytes, str], pagehandler.ParsedPage]] = {
+        "soup": lambda html, domain: pagehandler.parse_page(
+            pagehandler.get_content_soup(html), domain),
+        "stream": pagehandler.parse_stream,
+    }
+
+    times: dict[str, list[float]] = {name: [] for name in extractors}
+    peaks: dict[str, list[float]] = {name: [] for name in extractors}
+    mismatches = 0
+    for domain, html in pages:
+        parsed = []
+        for name, extract in extractors.items():
+            start = time.perf_counter()
+            parsed.append(extract(html, domain))
+            times[name].append((time.perf_counter() - start) * 1000)
+
+            # tracing slows parsing down so memory is measured separately
+            tracemalloc.start()
+            extract(html, domain)
+            peaks[name].append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        soup, stream = parsed
+        if (soup.text, soup.tokens.counts, soup.tokens.positions, soup.links) \
+                != (stream.text, stream.tokens.counts, stream.tokens.positions,
+                    stream.links):
+            mismatches += 1
+
+    print(f"{len(pages)} pages, {mismatches} with different output")
+    print(f"{'extractor':<18}{'mean ms':>10}{'p95 ms':>10}{'max ms':>10}"
+          f"{'mean KiB':>10}{'max KiB':>10}")
+    for name in extractors:
+        timings = summarise(times[name])
+        memory = summarise(peaks[name])
+        print(f"{name:<18}{timings['mean']:>10.3f}{timings['p95']:>10.3f}"
+              f"{timings['max']:>10.3f}{memory['mean']:>10.1f}{memory['max']:>10.1f}")
+
+
+def benchmark(query_count: int = 200) -> None:
+    """
+    Compare the search backends on the configured database, the result
+    cache is bypassed so each backend does the full work of every query
+    :param query_count: number of random queries
+    :return:
+    """
+    db = webstorage.open_database()
+    websearch.set_db(db)
+    limit = config.Config.RESULTS_PER_SEARCH.value
+
+    queries = sample_queries(db, query_count)
+    if not queries:
+        print("No tokens stored, crawl some pages first")
+        return
+
+    backends: dict[str, Callable[[str], list]] = {
+        "tokens": lambda query: websearch.score_subdomains(
+            tokens.get_tokens(query), limit),
+    }
+
+    index = InvertedIndex(db)
+    index.load()
+    backends["in memory index"] = lambda query: index.search(
+        tokens.get_tokens(query).counts, limit)
+
+    if fts_available(db):
+        backends["fts5"] = lambda query: websearch.score_subdomains_fts(
+            websearch.fts_match_expression(query), limit)
+    else:
+        print("PageText does not exist or the database is sharded, "
+              "enable fts index pages on a single shard to compare fts5")
+
+    print(f"{len(queries)} queries, {config.Config.SEARCH_RANKING.value} ranking")
+    print(f"{'backend':<18}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+    for name, search in backends.items():
+        timings = time_backend(search, queries)
+        print(f"{name:<18}" + "".join(f"{timings[column]:>10.3f}"
+                                      for column in ("mean", "p50", "p95", "max")))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "startup":
+        startup_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    elif len(sys.argv) > 1 and sys.argv[1] == "extract":
+        extract_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,43 @@
+import os
+import sqlite3
+
+import pytest
+
+import config
+import webstorage
+
+
+@pytest.fixture
+def open_database(request):
+    """
+    Open databases named after the test in the database folder, removed
+    again once the test has finished
+    """
+    databases: list[webstorage.Database] = []
+
+    def open_database(connect_function=sqlite3.connect) -> webstorage.Database:
+        os.makedirs(config.Config.DATABASE_FOLDER.value, exist_ok=True)
+        db = webstorage.Database(
+            f"{request.node.name}_{len(databases)}.db",
+            config.Config.INIT_SCRIPT.value,
+            script_directory=config.Config.SCRIPT_FOLDER.value,
+            connect_function=connect_function)
+        databases.append(db)
+        # the writer opens the database and read pool on its own thread
+        db.commit()
+        return db
+
+    yield open_database
+
+    for db in databases:
+        # the writer connection belongs to the daemon command thread
+        if db.read_pool is not None:
+            db.read_pool.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db.database + suffix):
+                os.remove(db.database + suffix)
+
+
+@pytest.fixture
+def database(open_database) -> webstorage.Database:
+    return open_database()
@@ -0,0 +1,58 @@
+import hashlib
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+import config
+
+
+def compression() -> str:
+    """
+    :return: codec new content is compressed with, zlib when zstd is
+    configured but the zstandard package is not installed
+    """
+    if config.Config.CONTENT_COMPRESSION.value == "zstd" and zstandard is not None:
+        return "zstd"
+    return "zlib"
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(
+            level=config.Config.CONTENT_COMPRESSION_LEVEL.value).compress(data)
+    return zlib.compress(data, config.Config.CONTENT_COMPRESSION_LEVEL.value)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is needed to read zstd compressed content")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def content_hash(text: str) -> bytes:
+    return hashlib.sha256(text.encode()).digest()
+
+
+def content_row(page_id: int, text: str, html: bytes | None) -> dict[str, bytes | int | str | None]:
+    """
+    Compress a page's content into the parameters of insert page content.sql
+    :param page_id: Subdomain id of the page
+    :param text: visible text of the page
+    :param html: raw html of the page if it should be kept
+    :return: parameters for the insert
+    """
+    codec = compression()
+    return {"page": page_id,
+            "content_hash": content_hash(text),
+            "compression": codec,
+            "text": compress(text.encode(), codec),
+            "html": None if html is None else compress(html, codec)}
+
+
+def read_text(data: bytes, codec: str) -> str:
+    return decompress(data, codec).decode()
@@ -0,0 +1,72 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Bounded mapping which evicts the least recently used entry when full
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self.entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class IdCaches:
+    """
+    Caches of row ids so inserts do not need to resolve them through
+    nested subqueries
+    websites: url -> Website.id
+    subdomains: (site_id, extension) -> Subdomain.id
+    tokens: text -> Token.token
+    """
+    def __init__(self, size: int):
+        self.websites = LRUCache(size)
+        self.subdomains = LRUCache(size)
+        self.tokens = LRUCache(size)
+        # schema the ids were read under, see check_schema
+        self.schema_version: int | None = None
+
+    def check_schema(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Clear the caches if the schema has changed since they were filled,
+        reindex.py replaces the token tables renumbering their rows
+        :param cursor: cursor on the database thread
+        :return:
+        """
+        schema_version = cursor.execute(
+            "PRAGMA schema_version").fetchone()["schema_version"]
+        if schema_version != self.schema_version:
+            self.clear()
+            self.schema_version = schema_version
+
+    def clear(self) -> None:
+        self.websites.clear()
+        self.subdomains.clear()
+        self.tokens.clear()
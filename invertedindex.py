@@ -0,0 +1,259 @@
+import bisect
+import heapq
+import threading
+from array import array
+from typing import Any
+
+import config
+import log
+import ranking
+import webstorage
+from subdomains import Subdomain
+
+
+class PostingList:
+    """
+    Pages containing a token with the token's occurrences on each, kept
+    sorted by page number in two parallel arrays
+    """
+    __slots__ = ("pages", "occurrences", "max_occurrences")
+
+    def __init__(self):
+        self.pages = array('I')
+        self.occurrences = array('I')
+        # upper bound used to skip pages, not lowered when rows are removed
+        self.max_occurrences = 0
+
+    def set(self, page: int, occurrences: int) -> None:
+        """
+        Set the occurrences of the token on a page, 0 removes the page
+        :param page: index page number
+        :param occurrences: new occurrences
+        :return:
+        """
+        position = bisect.bisect_left(self.pages, page)
+        exists = position < len(self.pages) and self.pages[position] == page
+
+        if not occurrences:
+            if exists:
+                del self.pages[position]
+                del self.occurrences[position]
+            return
+
+        if exists:
+            self.occurrences[position] = occurrences
+        else:
+            self.pages.insert(position, page)
+            self.occurrences.insert(position, occurrences)
+
+        self.max_occurrences = max(self.max_occurrences, occurrences)
+
+    def __len__(self):
+        return len(self.pages)
+
+
+class InvertedIndex:
+    """
+    In memory copy of Token/TokenOnPage for answering searches without
+    SQLite, pages are numbered by the index so shards can share it.
+    Scoring matches score pages with tokens.sql, top results are found with
+    MaxScore so pages which cannot reach the current top k are skipped.
+    """
+    def __init__(self, database: webstorage.Database | webstorage.ShardedDatabase):
+        self.db = database
+        self.postings: dict[str, PostingList] = dict()
+        self.page_numbers: dict[tuple[str, str], int] = dict()
+        self.pages: list[tuple[str, str]] = []
+        self.pageranks = array('d')
+        self.max_pagerank = 1.0
+        # tokens on each page and corpus totals for BM25
+        self.page_lengths = array('I')
+        self.document_count = 0
+        self.total_tokens = 0
+        self.lock = threading.Lock()
+
+    def load(self) -> None:
+        """
+        Read every token on every page from the database
+        :return:
+        """
+        with self.lock:
+            rows = 0
+            for url, extension, pagerank, token_total, text, occurrences \
+                    in self.db.iterate(config.Config.LOAD_INVERTED_INDEX.value,
+                                       is_file=True):
+                page = self.page_number(url, extension, pagerank)
+                if not self.page_lengths[page]:
+                    self.set_page_length(page, token_total)
+                if text not in self.postings:
+                    self.postings[text] = PostingList()
+                self.postings[text].set(page, occurrences)
+                rows += 1
+        log.log(f"Loaded inverted index of {len(self.pages)} pages, "
+                f"{len(self.postings)} tokens and {rows} postings")
+
+    def page_number(self, url: str, extension: str,
+                    pagerank: float | None = None) -> int:
+        key = (url, extension)
+        if key in self.page_numbers:
+            return self.page_numbers[key]
+
+        page = len(self.pages)
+        self.page_numbers[key] = page
+        self.pages.append(key)
+        self.pageranks.append(1.0 if pagerank is None else pagerank)
+        self.max_pagerank = max(self.max_pagerank, self.pageranks[page])
+        self.page_lengths.append(0)
+        return page
+
+    def set_page_length(self, page: int, length: int) -> None:
+        previous = self.page_lengths[page]
+        self.page_lengths[page] = length
+        self.document_count += bool(length) - bool(previous)
+        self.total_tokens += length - previous
+
+    def update_page(self, link: Subdomain,
+                    changes: dict[str, tuple[int, int]]) -> None:
+        """
+        Apply token count changes written by SiteDatabaseHandler
+        :param link: page the changes were made to
+        :param changes: token text -> (previous occurrences, new occurrences)
+        :return:
+        """
+        with self.lock:
+            page = self.page_number(link.domain, link.extension)
+            self.set_page_length(page, self.page_lengths[page] + sum(
+                occurrences - previous
+                for previous, occurrences in changes.values()))
+            for text, (previous, occurrences) in changes.items():
+                if text not in self.postings:
+                    if not occurrences:
+                        continue
+                    self.postings[text] = PostingList()
+                self.postings[text].set(page, occurrences)
+
+    def refresh_pageranks(self) -> None:
+        """
+        Copy pageranks from the database after a pagerank pass
+        :return:
+        """
+        pageranks = list(self.db.iterate(config.Config.GET_PAGERANKS.value,
+                                         is_file=True))
+        with self.lock:
+            for url, extension, pagerank in pageranks:
+                page = self.page_numbers.get((url, extension))
+                if page is not None:
+                    self.pageranks[page] = pagerank
+            self.max_pagerank = max(self.pageranks, default=1.0)
+
+    def search(self, query_counts: dict[str, int],
+               result_limit: int) -> list[dict[str, Any]]:
+        """
+        Find the best scoring pages for a query
+        :param query_counts: token text -> occurrences in the query
+        :param result_limit: number of pages to return
+        :return: pages with their query_ranking, best first
+        """
+        strength = config.Config.PAGE_RANK_STRENGTH.value
+        bm25 = config.Config.SEARCH_RANKING.value == "bm25"
+        total_tokens = sum(query_counts.values())
+
+        with self.lock:
+            postings = [(self.postings[text], count)
+                        for text, count in query_counts.items()
+                        if text in self.postings and len(self.postings[text])]
+            if not postings or result_limit <= 0:
+                return []
+
+            # (posting list, weight, most the token can add to a score)
+            terms: list[tuple[PostingList, float, float]] = []
+            if bm25:
+                average_page_length = ranking.average_length(
+                    self.document_count, self.total_tokens)
+                # occurrences / (occurrences + norm) grows with occurrences
+                # and the norm is smallest for an empty page
+                minimum_norm = ranking.bm25_norm(0, average_page_length)
+                for posting, count in postings:
+                    weight = ranking.bm25_weight(count, self.document_count,
+                                                 len(posting))
+                    terms.append((posting, weight,
+                                  weight * posting.max_occurrences
+                                  / (posting.max_occurrences + minimum_norm)))
+            else:
+                terms = [(posting, count, posting.max_occurrences * count)
+                         for posting, count in postings]
+
+            # least valuable terms first so they are the first to become
+            # non essential
+            terms.sort(key=lambda term: term[2])
+            bounds: list[float] = []
+            for posting, weight, bound in terms:
+                previous = bounds[-1] if bounds else 0
+                bounds.append(previous + bound)
+
+            max_boost = 1 + (self.max_pagerank - 1) * strength
+            cursors = [0] * len(terms)
+            essential = 0
+            threshold = 0.0
+            top: list[tuple[float, int]] = []
+
+            while True:
+                page = None
+                for i in range(essential, len(terms)):
+                    pages = terms[i][0].pages
+                    if cursors[i] < len(pages) and (page is None
+                                                    or pages[cursors[i]] < page):
+                        page = pages[cursors[i]]
+                if page is None:
+                    break
+
+                norm = ranking.bm25_norm(self.page_lengths[page],
+                                         average_page_length) if bm25 else 0
+                score = 0
+                for i in range(essential, len(terms)):
+                    posting, weight, bound = terms[i]
+                    if cursors[i] < len(posting.pages) \
+                            and posting.pages[cursors[i]] == page:
+                        score += self.term_score(
+                            posting.occurrences[cursors[i]], weight, norm, bm25)
+                        cursors[i] += 1
+
+                boost = 1 + (self.pageranks[page] - 1) * strength
+                for i in range(essential - 1, -1, -1):
+                    if (score + bounds[i]) * boost <= threshold:
+                        break
+                    posting, weight, bound = terms[i]
+                    cursors[i] = bisect.bisect_left(posting.pages, page,
+                                                    cursors[i])
+                    if cursors[i] < len(posting.pages) \
+                            and posting.pages[cursors[i]] == page:
+                        score += self.term_score(
+                            posting.occurrences[cursors[i]], weight, norm, bm25)
+                else:
+                    query_ranking = score * boost
+                    if len(top) < result_limit:
+                        heapq.heappush(top, (query_ranking, page))
+                    elif query_ranking > threshold:
+                        heapq.heapreplace(top, (query_ranking, page))
+
+                    if len(top) == result_limit:
+                        threshold = top[0][0]
+                        while essential < len(terms) \
+                                and bounds[essential] * max_boost <= threshold:
+                            essential += 1
+
+            results = []
+            for query_ranking, page in sorted(top, reverse=True):
+                url, extension = self.pages[page]
+                results.append({"url": url, "extension": extension,
+                                "pagerank": self.pageranks[page],
+                                "query_ranking": query_ranking if bm25
+                                else query_ranking / total_tokens})
+            return results
+
+    @staticmethod
+    def term_score(occurrences: int, weight: float, norm: float,
+                   bm25: bool) -> float:
+        if bm25:
+            return weight * occurrences / (occurrences + norm)
+        return weight * occurrences
@@ -1,18 +1,48 @@
 import requests
 from bs4 import BeautifulSoup
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution, UnicodeDammit
+from html.parser import HTMLParser
+from typing import Iterable, NamedTuple
+import config
 import log
 import tokens
 from subdomains import Subdomain
 
 
+class ParsedPage(NamedTuple):
+    links: dict[Subdomain, int]
+    tokens: tokens.TokenContainer
+    # visible text of the page for full text search and the content store,
+    # None when a parse worker left it out as neither is enabled
+    text: str | None
+    # raw page, only kept when store page html is set
+    html: bytes | None = None
+
+
+# token counts, token positions, link counts and text of a page in plain
+# builtins so it is cheap to send back from a parse worker
+PageCounts = tuple[dict[str, int], dict[str, list[int]] | None,
+                   dict[Subdomain, int], str | None]
+
+
 def get_page_soup(response: requests.Response) -> BeautifulSoup:
     """
     Extracts a BeautifulSoup object from a url
     :param response: Response from url
     :return: BeautifulSoup object
     """
+    return get_content_soup(response.content)
+
+
+def get_content_soup(content: bytes) -> BeautifulSoup:
+    """
+    Extracts a BeautifulSoup object from the raw bytes of a page
+    :param content: body of the response
+    :return: BeautifulSoup object without scripts or styles
+    """
 
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(content, 'html.parser')
     for script in soup.find_all('script'):
         script.decompose()
     for style in soup.find_all('style'):
@@ -29,21 +59,221 @@ def get_links(soup: BeautifulSoup,
     from in case only path specified
     :return: list of links in the object
     """
+    # anchors without a href are placeholders rather than links
+    return count_links((link.get('href') for link in soup.find_all('a')
+                        if link.get('href') is not None), parent_url)
+
+
+def count_links(hrefs: Iterable[str],
+                parent_url: str | None = None) -> dict[Subdomain, int]:
+    """
+    Count the links to each page
+    :param hrefs: href of every anchor on the page
+    :param parent_url: parent url to extract links
+    from in case only path specified
+    :return: occurrences of each link
+    """
     parent_url = parent_url.lower()
     links: dict[Subdomain, int] = dict()
-    all_links = soup.find_all('a')
-    for link in all_links:
-        sub = Subdomain(link.get('href').lower(),parent_url=parent_url)
-        for o_link in links:
-            if o_link.get_url() == sub.get_url():
-                links[o_link] += 1
-                break
-        else:
-            links[sub] = 1
+    # subdomains are equal when their urls are
+    for href in hrefs:
+        sub = Subdomain(href.lower(),parent_url=parent_url)
+        links[sub] = links.get(sub, 0) + 1
     log.log(f"found {len(links)} links making up {links.keys()}")
     return links
 
 
+def parse_page(soup: BeautifulSoup, parent_url: str) -> ParsedPage:
+    """
+    Extract the links, tokens and text of a page
+    :param soup: BeautifulSoup object
+    :param parent_url: domain of the page for relative links
+    :return: parsed page
+    """
+    text = soup.get_text()
+    return ParsedPage(get_links(soup, parent_url=parent_url),
+                      tokens.get_tokens(text), text)
+
+
+class PageExtractor(HTMLParser):
+    """
+    Collects the visible text and hrefs of a page in a single pass over
+    the html without building a tree, keeps the same text as
+    BeautifulSoup's get_text once scripts and styles are removed.
+    References and whitespace only strings are handled as BeautifulSoup's
+    html.parser builder does rather than by html.unescape, so &lang=en is
+    read as a reference without its semicolon
+    """
+    # contents of these are never visible, html.parser reads them raw so
+    # they cannot contain other tags
+    hidden_tags = frozenset(("script", "style"))
+    # whitespace only strings outside these become a single newline or space
+    preserve_whitespace_tags = frozenset(
+        HTMLTreeBuilder.DEFAULT_PRESERVE_WHITESPACE_TAGS)
+    void_tags = frozenset(HTMLTreeBuilder.DEFAULT_EMPTY_ELEMENT_TAGS)
+    ascii_spaces = frozenset("\x20\x0a\x09\x0c\x0d")
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.chunks: list[str] = []
+        # data of the string being read, strings end at any tag or comment
+        self.string: list[str] = []
+        self.hrefs: list[str] = []
+        self.hidden = 0
+        # names of the open tags, an end tag closes every tag opened after
+        # the last open tag of its name as in BeautifulSoup
+        self.open_tags: list[str] = []
+        self.preserve_whitespace = 0
+
+    def end_string(self) -> None:
+        if not self.string:
+            return
+        string = "".join(self.string)
+        self.string.clear()
+        if not self.preserve_whitespace \
+                and all(character in self.ascii_spaces for character in string):
+            string = "\n" if "\n" in string else " "
+        self.chunks.append(string)
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        self.end_string()
+        if tag not in self.void_tags:
+            self.open_tags.append(tag)
+            if tag in self.preserve_whitespace_tags:
+                self.preserve_whitespace += 1
+
+        if tag in self.hidden_tags:
+            self.hidden += 1
+        elif tag == "a":
+            href = None
+            # the last duplicate attribute wins as in BeautifulSoup
+            for name, value in attrs:
+                if name == "href":
+                    href = "" if value is None else value
+            if href is not None:
+                self.hrefs.append(href)
+
+    def handle_endtag(self, tag: str) -> None:
+        self.end_string()
+        if tag in self.hidden_tags and self.hidden:
+            self.hidden -= 1
+
+        if tag not in self.open_tags:
+            return
+        while True:
+            closed = self.open_tags.pop()
+            if closed in self.preserve_whitespace_tags:
+                self.preserve_whitespace -= 1
+            if closed == tag:
+                return
+
+    def handle_data(self, data: str) -> None:
+        if not self.hidden:
+            self.string.append(data)
+
+    def handle_entityref(self, name: str) -> None:
+        # unknown names are kept as text, without any semicolon
+        self.handle_data(EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(
+            name, "&" + name))
+
+    def handle_charref(self, name: str) -> None:
+        number = int(name[1:], 16) if name[0] in "xX" else int(name)
+        if number == 0 or number > 0x10ffff or 0xd800 <= number <= 0xdfff:
+            character = "\ufffd"
+        elif 0x80 <= number <= 0x9f:
+            # references to windows-1252 bytes written as code points,
+            # html.unescape would also drop other control characters
+            try:
+                character = bytes((number,)).decode("cp1252")
+            except UnicodeDecodeError:
+                character = chr(number)
+        else:
+            character = chr(number)
+        self.handle_data(character)
+
+    def handle_comment(self, data: str) -> None:
+        self.end_string()
+
+    def handle_decl(self, decl: str) -> None:
+        self.end_string()
+
+    def handle_pi(self, data: str) -> None:
+        self.end_string()
+
+    def unknown_decl(self, data: str) -> None:
+        # CDATA sections are a string of their own to BeautifulSoup, other
+        # declarations and comments are not text
+        self.end_string()
+        if data.startswith("CDATA[") and not self.hidden:
+            self.string.append(data[len("CDATA["):])
+            self.end_string()
+
+    def close(self) -> None:
+        super().close()
+        self.end_string()
+
+    def text(self) -> str:
+        return "".join(self.chunks)
+
+
+def parse_stream(content: bytes, parent_url: str) -> ParsedPage:
+    """
+    Parse the raw bytes of a page with PageExtractor
+    :param content: body of the response
+    :param parent_url: domain of the page for relative links
+    :return: parsed page
+    """
+    # decoded as BeautifulSoup would so both extractors see the same text
+    markup = UnicodeDammit(content, is_html=True).unicode_markup or ""
+    extractor = PageExtractor()
+    extractor.feed(markup)
+    extractor.close()
+    text = extractor.text()
+    return ParsedPage(count_links(extractor.hrefs, parent_url),
+                      tokens.get_tokens(text), text)
+
+
+def parse_content(content: bytes, parent_url: str) -> ParsedPage:
+    """
+    Parse the raw bytes of a page with the configured html extractor
+    :param content: body of the response
+    :param parent_url: domain of the page for relative links
+    :return: parsed page
+    """
+    if config.Config.HTML_EXTRACTOR.value == "stream":
+        return parse_stream(content, parent_url)
+    return parse_page(get_content_soup(content), parent_url)
+
+
+def text_needed() -> bool:
+    """
+    :return: whether the visible text of pages is indexed or stored
+    """
+    return (config.Config.SEARCH_BACKEND.value == "fts5"
+            or bool(config.Config.FTS_INDEX_PAGES.value)
+            or bool(config.Config.STORE_PAGE_CONTENT.value))
+
+
+def count_page(content: bytes, parent_url: str) -> PageCounts:
+    """
+    Run in a parse worker, parse a page into a picklable form. The text is
+    only sent back when needed as it is often larger than the counts
+    :param content: body of the response
+    :param parent_url: domain of the page for relative links
+    :return: counts of the page, see from_counts
+    """
+    page = parse_content(content, parent_url)
+    return (page.tokens.counts, page.tokens.positions, page.links,
+            page.text if text_needed() else None)
+
+
+def from_counts(counts: PageCounts) -> ParsedPage:
+    token_counts, token_positions, links, text = counts
+    return ParsedPage(links, tokens.TokenContainer(counts=token_counts,
+                                                   positions=token_positions),
+                      text)
+
+
 def get_tokens_from_soup(soup: BeautifulSoup) -> tokens.TokenContainer:
     """
     Extracts tokens from a BeautifulSoup object
@@ -4,11 +4,14 @@ import time
 import log
 import threading
 from subdomains import Subdomain
-from typing import Any, Generator
+from typing import Any, Callable, Generator
 
-db : None | webstorage.Database = None
+db : None | webstorage.Database | webstorage.ShardedDatabase = None
 
-def set_db(database: webstorage.Database):
+# called after every pagerank pass has been committed
+rank_listeners : list[Callable[[], None]] = []
+
+def set_db(database: webstorage.Database | webstorage.ShardedDatabase):
     global db
     db = database
 
@@ -19,11 +22,14 @@ def pagerank() -> None:
     # TODO migrate this to something involving/based on the matrix implementation
     :return:
     """
-    subdomain_count = db.execute(config.Config.GET_SUBDOMAIN_COUNT.value,
-                                 is_file=True)[0]['subdomain_count']
+    # one row per shard when sharded
+    subdomain_count = sum(
+        row['subdomain_count'] for row in
+        db.execute(config.Config.GET_SUBDOMAIN_COUNT.value, is_file=True))
 
     for subdomain in subdomain_generator():
-        # get all links to subdomain
+        # get all links to subdomain, links are stored with the page they
+        # are found on so they can be in any shard
         params = [subdomain.domain, subdomain.extension]
         backlinks = db.execute(config.Config.GET_BACKLINKS_PAGERANK.value,
                                is_file=True, params=params)
@@ -35,14 +41,21 @@ def pagerank() -> None:
         params = {'url':subdomain.domain,
                   'extension':subdomain.extension,
                   'new_rank':new_rank}
-        db.execute(config.Config.SET_TEMPORARY_SUBDOMAIN_RANK.value,
+        db.shard_for(subdomain.domain).execute(
+            config.Config.SET_TEMPORARY_SUBDOMAIN_RANK.value,
             params=params, is_file=True)
 
     db.execute(config.Config.MIGRATE_SUBDOMAIN_RANKS.value, is_file=True)
+    # make the new ranks visible to the read connections straight away
+    db.commit()
+
+    for listener in rank_listeners:
+        listener()
 
     if config.Config.LOG_TOTAL_PAGERANK.value:
-        total_rank = db.execute(
-            config.Config.GET_TOTAL_RANK.value, is_file=True)[0]['total_rank']
+        total_rank = sum(
+            row['total_rank'] or 0 for row in
+            db.execute(config.Config.GET_TOTAL_RANK.value, is_file=True))
         log.log(f"Total rank: {total_rank}")
 
 def calculate_new_pagerank(backlinks: list[dict[str, Any]],
@@ -69,13 +82,10 @@ def subdomain_generator() -> Generator[Subdomain, None, None]:
     Returns generator which yields subdomains to prevent entire table from being loaded into memory
     :return: Subdomain generator
     """
-    params = [config.Config.PAGE_RANK_MEMORY_ROWS.value, 0]
-    while subdomains := db.execute(config.Config.GET_SUBDOMAINS.value,
-            params=params, is_file=True):
-        for subdomain in subdomains:
-            url = "//" + subdomain["url"] + subdomain["extension"]
-            yield Subdomain(url)
-        params[1] += config.Config.PAGE_RANK_MEMORY_ROWS.value
+    for url, extension in db.iterate(
+            config.Config.GET_SUBDOMAINS.value, is_file=True,
+            batch_size=config.Config.PAGE_RANK_MEMORY_ROWS.value):
+        yield Subdomain("//" + url + extension)
 
 # TODO make a method of storing all links that need to be processed when the program is terminated
 
@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import config
+import log
+import pagehandler
+import processpool
+
+
+class ParsePool:
+    """
+    Parses pages in worker processes so the fetch threads of every domain
+    are not serialised on the GIL by BeautifulSoup and the tokenizer.
+    At most max_in_flight pages are queued or being parsed, fetch threads
+    wait for a slot so raw pages cannot pile up in memory
+    """
+    def __init__(self, workers: int, max_in_flight: int):
+        self.workers = workers
+        self.executor = processpool.executor(workers)
+        self.executor_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+
+    def parse(self, content: bytes, parent_url: str) -> pagehandler.ParsedPage:
+        """
+        Parse a page in a worker, blocking the calling thread until done
+        :param content: body of the response
+        :param parent_url: domain of the page for relative links
+        :return: parsed page
+        """
+        with self.slots:
+            executor = self.executor
+            try:
+                counts = executor.submit(pagehandler.count_page, content,
+                                         parent_url).result()
+            except BrokenProcessPool:
+                # a worker died, possibly on this page, every page it had
+                # queued is parsed inline whilst the pool is replaced
+                self.replace_executor(executor)
+                return pagehandler.parse_content(content, parent_url)
+        return pagehandler.from_counts(counts)
+
+    def replace_executor(self, broken) -> None:
+        """
+        Start a new pool in place of a broken one, only the first thread
+        to find the pool broken replaces it
+        :param broken: executor that raised BrokenProcessPool
+        :return:
+        """
+        with self.executor_lock:
+            if self.executor is not broken:
+                return
+            log.log("A parse worker died, restarting the parse pool")
+            self.executor = processpool.executor(self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+
+pool: ParsePool | None = None
+
+
+def start() -> None:
+    """
+    Move parsing of fetched pages off the fetch threads into worker
+    processes, until then pages are parsed inline
+    :return:
+    """
+    global pool
+    workers = config.Config.PARSE_WORKERS.value or os.cpu_count() or 1
+    max_in_flight = config.Config.PARSE_MAX_IN_FLIGHT.value or workers * 2
+    pool = ParsePool(workers, max_in_flight)
+    log.log(f"Parsing pages in {workers} processes, "
+            f"at most {max_in_flight} in flight")
+
+
+def stop() -> None:
+    global pool
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+
+
+def parse(content: bytes, parent_url: str) -> pagehandler.ParsedPage:
+    """
+    Parse a fetched page in the pool if started, otherwise inline
+    :param content: body of the response
+    :param parent_url: domain of the page for relative links
+    :return: parsed page
+    """
+    current = pool
+    if current is not None:
+        return current.parse(content, parent_url)
+    return pagehandler.parse_content(content, parent_url)
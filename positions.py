@@ -0,0 +1,83 @@
+def encode_positions(positions: list[int]) -> bytes:
+    """
+    Encode sorted positions as varints of the gaps between them, 7 bits per
+    byte with the high bit set on every byte but the last of a number
+    :param positions: word offsets in ascending order
+    :return: encoded positions
+    """
+    encoded = bytearray()
+    previous = 0
+    for position in positions:
+        gap = position - previous
+        previous = position
+        while gap >= 0x80:
+            encoded.append((gap & 0x7f) | 0x80)
+            gap >>= 7
+        encoded.append(gap)
+    return bytes(encoded)
+
+
+def decode_positions(encoded: bytes) -> list[int]:
+    """
+    :param encoded: positions from encode_positions
+    :return: word offsets in ascending order
+    """
+    positions: list[int] = []
+    position = 0
+    gap = 0
+    shift = 0
+    for byte in encoded:
+        gap |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        position += gap
+        positions.append(position)
+        gap = 0
+        shift = 0
+    return positions
+
+
+def phrase_matches(query: list[tuple[int, str]],
+                   page_positions: dict[str, list[int]]) -> int:
+    """
+    Count the places a page contains the query's tokens at the same
+    offsets from each other as in the query
+    :param query: (offset, token) of each token in the query, ascending
+    :param page_positions: token -> positions of the token on the page
+    :return: number of matches
+    """
+    first_offset, first_token = query[0]
+    others = [(offset - first_offset, set(page_positions[token]))
+              for offset, token in query[1:]]
+    return sum(all(start + offset in positions for offset, positions in others)
+               for start in page_positions[first_token])
+
+
+def proximity_matches(query_tokens: set[str],
+                      page_positions: dict[str, list[int]],
+                      window: int) -> int:
+    """
+    Count the places every query token appears, in any order, within a
+    window of word offsets
+    :param query_tokens: tokens of the query
+    :param page_positions: token -> positions of the token on the page
+    :param window: largest distance from the first to the last token
+    :return: number of windows ending at a distinct position
+    """
+    merged = sorted((position, token) for token in query_tokens
+                    for position in page_positions[token])
+    counts: dict[str, int] = dict()
+    matches = 0
+    start = 0
+    for position, token in merged:
+        counts[token] = counts.get(token, 0) + 1
+        while merged[start][0] < position - window:
+            start_token = merged[start][1]
+            counts[start_token] -= 1
+            if not counts[start_token]:
+                del counts[start_token]
+            start += 1
+        if len(counts) == len(query_tokens):
+            matches += 1
+    return matches
@@ -0,0 +1,25 @@
+import concurrent.futures
+import multiprocessing
+
+
+def start_method() -> str:
+    """
+    fork is unsafe with the database threads and sqlite connections
+    already running, workers are started from a clean process instead
+    :return: multiprocessing start method for worker processes
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return "forkserver"
+    return "spawn"
+
+
+def executor(workers: int) -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Process pool for CPU bound work, whatever runs in it and the arguments
+    it is given must be picklable
+    :param workers: processes in the pool
+    :return: process pool
+    """
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(start_method()))
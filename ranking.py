@@ -0,0 +1,54 @@
+import math
+
+import config
+
+
+def inverse_document_frequency(document_count: int,
+                               document_frequency: int) -> float:
+    """
+    BM25 idf, kept positive for tokens on more than half of the pages
+    :param document_count: pages with at least one token
+    :param document_frequency: pages containing the token
+    :return: idf of the token
+    """
+    return math.log(1 + (document_count - document_frequency + 0.5)
+                    / (document_frequency + 0.5))
+
+
+def average_length(document_count: int, total_tokens: int) -> float:
+    """
+    Average tokens per page, 1 for an empty corpus to avoid dividing by 0
+    :param document_count: pages with at least one token
+    :param total_tokens: tokens across every page
+    :return: average page length
+    """
+    if not document_count or not total_tokens:
+        return 1.0
+    return total_tokens / document_count
+
+
+def bm25_weight(query_count: int, document_count: int,
+                document_frequency: int) -> float:
+    """
+    Weight of a query token, multiplied by occurrences / (occurrences + norm)
+    of the token on a page to give the page's BM25 score for the token
+    :param query_count: occurrences of the token in the query
+    :param document_count: pages with at least one token
+    :param document_frequency: pages containing the token
+    :return: weight of the token
+    """
+    return (query_count * (config.Config.BM25_K1.value + 1)
+            * inverse_document_frequency(document_count, document_frequency))
+
+
+def bm25_norm(page_length: int, average_page_length: float) -> float:
+    """
+    Length normalisation of a page, longer pages need more occurrences of a
+    token to score as highly
+    :param page_length: tokens on the page
+    :param average_page_length: average tokens per page
+    :return: norm added to the occurrences of each token on the page
+    """
+    b = config.Config.BM25_B.value
+    return config.Config.BM25_K1.value * (
+        1 - b + b * page_length / average_page_length)
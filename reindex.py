@@ -0,0 +1,208 @@
+import concurrent.futures
+import os
+import re
+import time
+from typing import Iterator
+
+import config
+import contentstore
+import log
+import positions
+import processpool
+import tokens
+import webstorage
+
+# page id, compression, compressed text
+StoredPage = tuple[int, str, bytes]
+# page id, [(token text, occurrences, encoded positions)]
+TokenizedPage = tuple[int, list[tuple[str, int, bytes | None]]]
+
+
+def tokenize_pages(pages: list[StoredPage]) -> list[TokenizedPage]:
+    """
+    Run in a worker process, decompress and tokenize a batch of pages
+    :param pages: stored pages
+    :return: tokens of each page
+    """
+    store_positions = config.Config.STORE_TOKEN_POSITIONS.value
+    tokenized = []
+    for page_id, compression, text in pages:
+        page_tokens = tokens.get_tokens(contentstore.read_text(text, compression))
+        tokenized.append((page_id, [
+            (token.token_name, token.token_count,
+             positions.encode_positions(sorted(token.positions))
+             if store_positions and token.positions is not None else None)
+            for token in page_tokens.tokens()]))
+    return tokenized
+
+
+def page_batches(db: webstorage.Database, batch_size: int,
+                 script: str | None = None) -> Iterator[list[StoredPage]]:
+    batch: list[StoredPage] = []
+    for page in db.iterate(script or config.Config.REINDEX_GET_PAGE_CONTENT.value,
+                           is_file=True):
+        batch.append(tuple(page))
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuilt_schema(db: webstorage.Database) -> tuple[str, str]:
+    """
+    Read the schema of the token tables so the rebuilt tables match
+    whatever the migrations have made of them
+    :param db: database being rebuilt
+    :return: sql creating the empty ...New tables and sql recreating the
+    indexes of the tables once swapped in
+    """
+    tables = []
+    indexes = []
+    for row in db.execute(config.Config.REINDEX_GET_TOKEN_SCHEMA.value,
+                          is_file=True):
+        if row["type"] == "table":
+            tables.append(re.sub(rf'^CREATE TABLE\s+"?{row["name"]}"?',
+                                 f'CREATE TABLE {row["name"]}New',
+                                 row["sql"], count=1))
+        else:
+            indexes.append(row["sql"])
+    return ("".join(sql + ";\n" for sql in tables),
+            "".join(sql + ";\n" for sql in indexes))
+
+
+class Progress:
+    """
+    Logs pages done, throughput and time remaining at most every interval
+    """
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.start = time.perf_counter()
+        self.last_report = self.start
+
+    def add(self, pages: int) -> None:
+        self.done += pages
+        now = time.perf_counter()
+        if now - self.last_report >= self.interval or self.done == self.total:
+            self.last_report = now
+            self.report()
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        rate = self.done / elapsed if elapsed else 0.0
+        remaining = (self.total - self.done) / rate if rate else 0.0
+        log.log(f"Reindexed {self.done}/{self.total} pages, "
+                f"{rate:.1f} pages/s, {elapsed:.1f}s elapsed, "
+                f"{remaining:.1f}s remaining")
+
+
+def reindex_database(db: webstorage.Database,
+                     executor: concurrent.futures.ProcessPoolExecutor,
+                     workers: int) -> None:
+    """
+    Rebuild the token tables of a single database file
+    :param db: database to rebuild
+    :param executor: pool tokenizing the pages
+    :param workers: processes in the pool, bounds the batches in flight
+    :return:
+    """
+    total = db.execute(config.Config.REINDEX_COUNT_PAGES.value,
+                       is_file=True)[0]["pages"]
+    log.log(f"Reindexing {total} pages of {db.database} with {workers} workers")
+    progress = Progress(total, config.Config.REINDEX_PROGRESS_SECONDS.value)
+
+    create_tables, create_indexes = rebuilt_schema(db)
+    db.execute_script(config.Config.REINDEX_CREATE_TABLES.value,
+                      params={"create_tables": create_tables})
+
+    # ids are assigned here as the new tables start empty
+    token_ids: dict[str, int] = dict()
+
+    def load(tokenized: list[TokenizedPage]) -> None:
+        new_tokens: list[tuple[int, str]] = []
+        occurrences: list[tuple[int, int, int]] = []
+        encoded_positions: list[tuple[int, int, bytes]] = []
+        for page_id, page_tokens in tokenized:
+            for text, count, encoded in page_tokens:
+                if text not in token_ids:
+                    token_ids[text] = len(token_ids) + 1
+                    new_tokens.append((token_ids[text], text))
+                occurrences.append((page_id, token_ids[text], count))
+                if encoded is not None:
+                    encoded_positions.append((page_id, token_ids[text], encoded))
+
+        db.execute_many(config.Config.REINDEX_INSERT_TOKEN.value, new_tokens)
+        db.execute_many(config.Config.REINDEX_INSERT_TOKEN_ON_PAGE.value,
+                        occurrences)
+        db.execute_many(config.Config.REINDEX_INSERT_TOKEN_POSITIONS.value,
+                        encoded_positions)
+        progress.add(len(tokenized))
+
+    # keep a couple of batches queued per worker without reading every
+    # page into memory up front
+    in_flight: set[concurrent.futures.Future] = set()
+    for batch in page_batches(db, config.Config.REINDEX_BATCH_PAGES.value):
+        in_flight.add(executor.submit(tokenize_pages, batch))
+        if len(in_flight) >= workers * 2:
+            done, in_flight = concurrent.futures.wait(
+                in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                load(future.result())
+
+    for future in concurrent.futures.as_completed(in_flight):
+        load(future.result())
+
+    db.execute_script(config.Config.REINDEX_SWAP_TABLES.value,
+                      params={"create_indexes": create_indexes})
+    db.commit()
+    log.log(f"Swapped in rebuilt token tables of {db.database}, "
+            f"{len(token_ids)} distinct tokens")
+
+
+def backfill_page_text(db: webstorage.Database) -> None:
+    """
+    Add the stored content of pages crawled before fts indexing was
+    enabled to the full text index
+    :param db: database to backfill
+    :return:
+    """
+    db.execute_script(config.Config.ENSURE_FTS_TABLE.value)
+    added = 0
+    for batch in page_batches(db, config.Config.REINDEX_BATCH_PAGES.value,
+                              config.Config.REINDEX_GET_MISSING_PAGE_TEXT.value):
+        db.execute_many(config.Config.INSERT_PAGE_TEXT.value, [
+            {"page": page_id, "text": contentstore.read_text(text, compression)}
+            for page_id, compression, text in batch])
+        added += len(batch)
+    db.commit()
+    log.log(f"Added {added} stored pages of {db.database} to the fts index")
+
+
+def reindex(db: webstorage.Database | webstorage.ShardedDatabase) -> None:
+    """
+    Rebuild the token tables of every shard from stored page content after
+    the tokenizer has changed. Pages are tokenized across every core and
+    bulk loaded into fresh tables which then replace the old ones in a
+    single transaction. Run with the crawler stopped, pages it writes
+    meanwhile may be replaced by their stored content. A crawler left
+    running clears its cached ids when it sees the schema change. With
+    fts enabled stored pages missing from the full text index are added
+    :param db: database to rebuild
+    :return:
+    """
+    workers = config.Config.REINDEX_WORKERS.value or os.cpu_count() or 1
+    shards = db.shards if isinstance(db, webstorage.ShardedDatabase) else [db]
+    start = time.perf_counter()
+    with processpool.executor(workers) as executor:
+        for shard in shards:
+            reindex_database(shard, executor, workers)
+            if (config.Config.SEARCH_BACKEND.value == "fts5"
+                    or config.Config.FTS_INDEX_PAGES.value):
+                backfill_page_text(shard)
+    log.log(f"Reindex finished in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    reindex(webstorage.open_database())
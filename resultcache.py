@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Any, Hashable
+
+from idcache import LRUCache
+from tokens import TokenContainer
+
+
+class ResultCache:
+    """
+    Search results keyed on the token counts of a query. Entries are
+    tagged with the generation they were stored in and ignored once it is
+    bumped, the crawler bumps it when tokens or pageranks change.
+    Entries also expire after max_age seconds as writes from another
+    process are not seen
+    """
+    def __init__(self, size: int, max_age: float | None = None):
+        self.entries = LRUCache(size)
+        self.max_age = max_age
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(query_tokens: TokenContainer, *extra: Hashable) -> Hashable:
+        """
+        Normalise a query so the same tokens in any order share an entry
+        :param query_tokens: tokens of the query
+        :param extra: anything else the results depend on e.g. the limit
+        :return: cache key
+        """
+        return (tuple(sorted(query_tokens.counts.items())),) + extra
+
+    def get(self, key: Hashable) -> list[dict[str, Any]] | None:
+        entry = self.entries.get(key)
+        with self.lock:
+            if entry is not None:
+                generation, stored, results = entry
+                if generation == self.generation and (
+                        self.max_age is None
+                        or time.monotonic() - stored < self.max_age):
+                    self.hits += 1
+                    return results
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, results: list[dict[str, Any]],
+            generation: int) -> None:
+        """
+        Store results computed from the data of a generation, results of an
+        older generation are dropped
+        :param key: cache key
+        :param results: results of the query
+        :param generation: generation read before the results were computed
+        :return:
+        """
+        if generation == self.generation:
+            self.entries.put(key, (generation, time.monotonic(), results))
+
+    def invalidate(self, *args, **kwargs) -> None:
+        """
+        Bump the generation, accepts and ignores the arguments of token and
+        rank listeners so it can be registered as either
+        :return:
+        """
+        with self.lock:
+            self.generation += 1
+
+    def statistics(self) -> dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": len(self.entries),
+                    "generation": self.generation}
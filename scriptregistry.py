@@ -0,0 +1,105 @@
+import threading
+
+import config
+import log
+
+# Placeholders expanded into one parameter marker per item
+TEMPLATE_PLACEHOLDERS: dict[str, str] = {
+    "token_amount": "?",
+    "query_values": "(?, ?)",
+}
+
+class ScriptRegistry:
+    """
+    Holds every sql script named in the config in memory so queries do not
+    touch the disk, templated scripts are rendered once per arity so the
+    sqlite3 statement cache sees identical sql text between calls
+    """
+    def __init__(self, script_directory: str, prerender_arities: int = 0):
+        self.script_directory = script_directory
+        self.prerender_arities = prerender_arities
+        self.scripts: dict[str, str] = dict()
+        self.rendered: dict[tuple[str, tuple[tuple[str, int], ...]], str] = dict()
+        self.lock = threading.Lock()
+        self.reload()
+
+    @staticmethod
+    def configured_scripts() -> set[str]:
+        """
+        Get the file names of every script referenced by the config
+        :return: set of script file names
+        """
+        return {member.value for member in config.Config
+                if isinstance(member.value, str)
+                and member.value.endswith(".sql")}
+
+    def read_script(self, script: str) -> str:
+        with open(self.script_directory + script, 'r') as f:
+            return f.read()
+
+    def reload(self) -> None:
+        """
+        Re-read every configured script from disk and drop rendered templates
+        Useful whilst editing scripts during development
+        :return:
+        """
+        scripts = dict()
+        for script in self.configured_scripts():
+            try:
+                scripts[script] = self.read_script(script)
+            except FileNotFoundError:
+                log.log(f"Configured script {script} does not exist")
+
+        with self.lock:
+            self.scripts = scripts
+            self.rendered = dict()
+
+        for script, sql_script in scripts.items():
+            placeholders = [placeholder for placeholder in TEMPLATE_PLACEHOLDERS
+                            if "{" + placeholder + "}" in sql_script]
+            if not placeholders:
+                continue
+            for arity in range(1, self.prerender_arities + 1):
+                self.render(script,
+                            **{placeholder: arity for placeholder in placeholders})
+
+    def get(self, script: str) -> str:
+        """
+        Get the text of a script, scripts missing from the config are read
+        from disk on first use
+        :param script: script file name
+        :return: sql text
+        """
+        try:
+            return self.scripts[script]
+        except KeyError:
+            pass
+
+        sql_script = self.read_script(script)
+        with self.lock:
+            self.scripts[script] = sql_script
+        return sql_script
+
+    def render(self, script: str, **arities: int) -> str:
+        """
+        Get a templated script with each placeholder expanded to the given
+        number of parameter markers
+        :param script: script file name
+        :param arities: number of items for each placeholder
+        :return: sql text ready to be executed
+        """
+        key = (script, tuple(sorted(arities.items())))
+        try:
+            return self.rendered[key]
+        except KeyError:
+            pass
+
+        format_params = {
+            placeholder: ",".join([TEMPLATE_PLACEHOLDERS[placeholder]] * arity)
+            for placeholder, arity in arities.items()
+        }
+        sql_script = self.get(script).format(**format_params)
+
+        with self.lock:
+            self.rendered[key] = sql_script
+        return sql_script
@@ -0,0 +1,248 @@
+import collections
+import json
+import statistics
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+import config
+import log
+import webstorage
+import websearch
+
+
+class LatencyTracker:
+    """
+    Latencies of the most recent requests to each endpoint
+    """
+    def __init__(self, window: int):
+        self.window = window
+        self.latencies: dict[str, collections.deque[float]] = dict()
+        self.counts: dict[str, int] = dict()
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, milliseconds: float) -> None:
+        with self.lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = collections.deque(maxlen=self.window)
+                self.counts[endpoint] = 0
+            self.latencies[endpoint].append(milliseconds)
+            self.counts[endpoint] += 1
+
+    def statistics(self) -> dict[str, dict[str, float]]:
+        with self.lock:
+            latencies = {endpoint: sorted(times)
+                         for endpoint, times in self.latencies.items()}
+            counts = dict(self.counts)
+
+        return {endpoint: {"requests": counts[endpoint],
+                           "mean_ms": statistics.fmean(times),
+                           "p50_ms": times[len(times) // 2],
+                           "p95_ms": times[int(len(times) * 0.95)],
+                           "max_ms": times[-1]}
+                for endpoint, times in latencies.items()}
+
+
+latency = LatencyTracker(config.Config.SEARCH_SERVER_LATENCY_WINDOW.value)
+start_time = time.time()
+
+
+def result_limit(requested: Any) -> int:
+    """
+    :param requested: limit given by the client, if any
+    :return: limit within the configured maximum
+    """
+    if requested is None:
+        return config.Config.RESULTS_PER_SEARCH.value
+    return max(0, min(int(requested),
+                      config.Config.SEARCH_SERVER_MAX_RESULTS.value))
+
+
+def format_results(subdomains: list[dict[str, Any]], query: str,
+                   snippets: bool) -> list[dict[str, Any]]:
+    if snippets:
+        subdomains = websearch.add_snippets(subdomains, query)
+    return [{"url": subdomain['url'] + subdomain['extension'],
+             "pagerank": subdomain['pagerank'],
+             "score": subdomain['query_ranking']}
+            | ({"snippet": subdomain['snippet']} if snippets else {})
+            for subdomain in subdomains]
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON endpoints
+    GET  /search?q=...&limit=n&snippets=1
+    POST /search        {"query": "...", "limit": n, "snippets": true}
+    POST /search_many   {"queries": ["...", ...], "limit": n, "snippets": true}
+    GET  /stats
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/search":
+            params = urllib.parse.parse_qs(url.query)
+            self.handle_endpoint("search", self.search, {
+                "query": params.get("q", [""])[0],
+                "limit": params.get("limit", [None])[0],
+                "snippets": params.get("snippets", ["0"])[0] not in ("0", "")})
+        elif url.path == "/stats":
+            self.handle_endpoint("stats", self.stats, {})
+        else:
+            self.send_json(404, {"error": f"unknown endpoint {url.path}"})
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        endpoints = {"/search": self.search, "/search_many": self.search_many}
+        if url.path not in endpoints:
+            self.send_json(404, {"error": f"unknown endpoint {url.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+        except ValueError as e:
+            self.send_json(400, {"error": f"invalid JSON body: {e}"})
+            return
+
+        self.handle_endpoint(url.path[1:], endpoints[url.path], body)
+
+    def handle_endpoint(self, endpoint: str,
+                        handler: Callable[[dict[str, Any]], dict[str, Any]],
+                        body: dict[str, Any]) -> None:
+        start = time.perf_counter()
+        try:
+            response = handler(body)
+            status = 200
+        except (KeyError, TypeError, ValueError) as e:
+            response = {"error": f"bad request: {e!r}"}
+            status = 400
+        except Exception as e:
+            log.log(f"Search server error on {endpoint}: {e!r}")
+            response = {"error": "internal error"}
+            status = 500
+
+        elapsed = (time.perf_counter() - start) * 1000
+        latency.record(endpoint, elapsed)
+        response["elapsed_ms"] = elapsed
+        self.send_json(status, response)
+
+    @staticmethod
+    def search(body: dict[str, Any]) -> dict[str, Any]:
+        query = body["query"]
+        if not isinstance(query, str):
+            raise TypeError("query must be a string")
+        subdomains = websearch.search_results(query,
+                                              result_limit(body.get("limit")))
+        return {"query": query,
+                "results": format_results(subdomains, query,
+                                          bool(body.get("snippets")))}
+
+    @staticmethod
+    def search_many(body: dict[str, Any]) -> dict[str, Any]:
+        queries = body["queries"]
+        if not isinstance(queries, list) \
+                or not all(isinstance(query, str) for query in queries):
+            raise TypeError("queries must be a list of strings")
+        if len(queries) > config.Config.SEARCH_SERVER_MAX_BATCH.value:
+            raise ValueError(f"at most {config.Config.SEARCH_SERVER_MAX_BATCH.value}"
+                             f" queries can be sent at once")
+        all_subdomains = websearch.search_results_many(
+            queries, result_limit(body.get("limit")))
+        snippets = bool(body.get("snippets"))
+        return {"results": [{"query": query,
+                             "results": format_results(subdomains, query, snippets)}
+                            for query, subdomains in zip(queries, all_subdomains)]}
+
+    @staticmethod
+    def stats(body: dict[str, Any]) -> dict[str, Any]:
+        return {"uptime_seconds": time.time() - start_time,
+                "latency": latency.statistics(),
+                "result_cache": websearch.result_cache.statistics(),
+                "in_memory_index": websearch.index is not None,
+                "search_backend": config.Config.SEARCH_BACKEND.value,
+                "search_ranking": config.Config.SEARCH_RANKING.value}
+
+    def send_json(self, status: int, response: dict[str, Any]) -> None:
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        # requests are summarised by /stats rather than logged one by one
+        pass
+
+
+def warm_up() -> None:
+    """
+    Run a query through every stage so the tokenizer, scripts and
+    connections are ready before the first client arrives
+    :return:
+    """
+    start = time.perf_counter()
+    websearch.search_results("search", 1)
+    websearch.search_results_many(["web search"], 1)
+    log.log(f"Search server warmed up in "
+            f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+def reload_daemon(database: webstorage.Database | webstorage.ShardedDatabase,
+                  interval: float) -> None:
+    """
+    Reload the in memory index and drop cached results whenever a crawler
+    has committed since the last check, a crawler in another process
+    cannot update them directly
+    :param database: database being searched
+    :param interval: seconds between checks
+    :return:
+    """
+    data_version = database.data_version()
+    while True:
+        time.sleep(interval)
+        current = database.data_version()
+        if current == data_version:
+            continue
+        data_version = current
+        start = time.perf_counter()
+        websearch.reload_index()
+        log.log(f"Search server reloaded in "
+                f"{(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+def serve(database: webstorage.Database | webstorage.ShardedDatabase) -> None:
+    """
+    Serve searches until interrupted, each request is handled on its own
+    thread and reads run on the database's read connections. The in memory
+    index is a snapshot reloaded every search server reload seconds if the
+    database has changed
+    :param database: database to search
+    :return:
+    """
+    websearch.set_db(database)
+    warm_up()
+
+    if config.Config.SEARCH_SERVER_RELOAD_SECONDS.value:
+        threading.Thread(target=reload_daemon, daemon=True, args=(
+            database, config.Config.SEARCH_SERVER_RELOAD_SECONDS.value)).start()
+
+    address = (config.Config.SEARCH_SERVER_HOST.value,
+               config.Config.SEARCH_SERVER_PORT.value)
+    server = ThreadingHTTPServer(address, SearchRequestHandler)
+    server.daemon_threads = True
+    log.log(f"Search server listening on {address[0]}:{address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve(webstorage.open_database())
@@ -1,32 +1,49 @@
+from idcache import IdCaches
+import contentstore
+from positions import encode_positions
 from subdomains import Subdomain
-from typing import Any, Generator, Iterable
+from typing import Any, Callable, Generator, Iterable
 from tokens import TokenContainer
 import datetime
+import sqlite3
 import webstorage
 import log
 import config
 import inspect
 
-class SiteDatabaseHandler:
-    def __init__(self, database: webstorage.Database):
-        self.db: webstorage.Database = database
-
-    def delete_tokens_not_in(self, origin: Subdomain, tokens: TokenContainer):
-
-        params = [origin.domain, origin.extension] + list(tokens.token_names())
+# token text -> (previous occurrences, new occurrences), 0 when absent
+TokenChanges = dict[str, tuple[int, int]]
 
-        sql_script = self.db.get_script(config.Config.DELETE_OLD_TOKENS.value)
+class SiteDatabaseHandler:
+    def __init__(self, database: webstorage.Database | webstorage.ShardedDatabase):
+        self.db: webstorage.Database | webstorage.ShardedDatabase = database
+        # ids are only valid within the shard they were read from
+        self.ids: dict[webstorage.Database, IdCaches] = dict()
+        # called with the page and its changes after tokens are written
+        self.token_listeners: list[Callable[[Subdomain, TokenChanges], None]] = []
 
-        format_params = {"new_tokens": ",".join(["?"] * len(tokens))}
-        sql_query = sql_script.format(**format_params)
+        if self.index_page_text():
+            self.db.execute_script(config.Config.ENSURE_FTS_TABLE.value)
 
-        self.db.execute(sql_query, params)
+    @staticmethod
+    def index_page_text() -> bool:
+        return (config.Config.SEARCH_BACKEND.value == "fts5"
+                or bool(config.Config.FTS_INDEX_PAGES.value))
+
+    def get_ids(self, database: webstorage.Database) -> IdCaches:
+        if database not in self.ids:
+            ids = IdCaches(config.Config.ID_CACHE_SIZE.value)
+            # ids cached from a rolled back batch would point at other rows
+            database.rollback_listeners.append(ids.clear)
+            self.ids[database] = ids
+        return self.ids[database]
 
     def delete_links_not_in(self, origin: Subdomain, links: Iterable[Subdomain]) -> None:
 
         sql_script = self.db.get_script(config.Config.DELETE_OLD_LINKS.value)
 
-        self.db.execute(sql_script, params=(origin.domain, origin.extension))
+        self.db.shard_for(origin.domain).execute(
+            sql_script, params=(origin.domain, origin.extension))
 
     def update_links(self, origin: Subdomain, targets: dict[Subdomain, int]) -> None:
         log.log(f"Update links for {origin} links provided are {targets}")
@@ -38,25 +55,31 @@ class SiteDatabaseHandler:
 
         log.log(f"TARGETS: {list(target.domain + target.extension for target in targets)}")
 
+        # links are stored in the shard of the page they are found on
+        db = self.db.shard_for(origin.domain)
+
         if config.Config.EXECUTE_MANY.value:
             links = SiteDatabaseHandler.link_generator(origin, targets)
 
             targets = list(SiteDatabaseHandler.individual_link_generator(targets))
 
-            self.db.execute_many(config.Config.ENSURE_DOMAIN_EXISTS.value, params=targets)
+            db.execute_many(config.Config.ENSURE_DOMAIN_EXISTS.value, params=targets)
 
-            self.db.execute_many(config.Config.ENSURE_LINK_EXISTS.value, params=targets)
+            db.execute_many(config.Config.ENSURE_LINK_EXISTS.value, params=targets)
 
-            #self.db.execute_many(config.Config.INSERT_MANY_PAGE_LINK.value,
-            #                params=links)
+            if config.Config.PRODUCTION.value:
+                db.execute_many(config.Config.INSERT_MANY_PAGE_LINK.value,
+                                params=links)
+                return
 
+            # verification of every link is only wanted whilst debugging
             for link in links:
-                pre_check = self.db.execute(config.Config.CHECK_SUBDOMAIN.value,
-                                            params={"url": link["target_url"], "extension":link["target_extension"]}, is_file=True)
+                pre_check = db.execute(config.Config.CHECK_SUBDOMAIN.value,
+                                       params={"url": link["target_url"], "extension":link["target_extension"]}, is_file=True)
                 log.log(f"Inserting link {link}")
                 log.log(f"ID before insertion is {pre_check}")
-                self.db.execute(config.Config.INSERT_MANY_PAGE_LINK.value, params=link, is_file=True)
-                check = self.db.execute(config.Config.CHECK_LINK_INSERTED.value, params=link, is_file=True)
+                db.execute(config.Config.INSERT_MANY_PAGE_LINK.value, params=link, is_file=True)
+                check = db.execute(config.Config.CHECK_LINK_INSERTED.value, params=link, is_file=True)
                 log.log(check)
 
         else:
@@ -76,7 +99,7 @@ class SiteDatabaseHandler:
                         f"Error occurred while updating links for {origin}, link was {target}\n Traceback: {"\n".join(repr(i) for i in inspect.stack())}")
                     raise
 
-                self.db.execute_script(config.Config.INSERT_PAGE_LINK.value,
+                db.execute_script(config.Config.INSERT_PAGE_LINK.value,
                                   params=connection)
 
     @staticmethod
@@ -109,35 +132,372 @@ class SiteDatabaseHandler:
                 log.log(f"Found connection to somewhere at {connection}")
             yield connection
 
-    def update_tokens(self, site: Subdomain, page_tokens: TokenContainer) -> None:
-        self.delete_tokens_not_in(site, page_tokens)
+    def update_tokens(self, site: Subdomain,
+                      page_tokens: TokenContainer) -> TokenChanges:
+        """
+        Bring the stored token counts of a page in line with page_tokens
+        :param site: page the tokens were found on
+        :param page_tokens: tokens found on the page
+        :return: changes made to the page's token counts
+        """
+        shard = self.db.shard_for(site.domain)
+        changes = shard.transaction(self.write_site_tokens, self.get_ids(shard),
+                                    site, page_tokens)
+        self.notify_token_listeners(site, changes)
+        return changes
+
+    def notify_token_listeners(self, site: Subdomain,
+                               changes: TokenChanges) -> None:
+        if not changes:
+            return
+        for listener in self.token_listeners:
+            listener(site, changes)
+
+    def write_site_tokens(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                          site: Subdomain,
+                          page_tokens: TokenContainer) -> TokenChanges:
+        try:
+            ids.check_schema(cursor)
+            page_id = self.subdomain_id(cursor, ids, site)
+            return self.write_tokens(cursor, ids, page_id, page_tokens)
+        except Exception:
+            ids.clear()
+            raise
+
+    def write_tokens(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                     page_id: int, page_tokens: TokenContainer) -> TokenChanges:
+        """
+        Diff the page's tokens against the stored counts and only write the
+        rows which were added, changed or removed
+        :param cursor: cursor on the database thread
+        :param ids: id caches of the shard the cursor belongs to
+        :param page_id: Subdomain id of the page
+        :param page_tokens: tokens found on the page
+        :return: changes made to the page's token counts
+        """
+        stored: dict[str, tuple[int, int]] = dict()
+        stored_positions: dict[str, bytes | None] = dict()
+        for row in cursor.execute(
+                self.db.get_script(config.Config.GET_PAGE_TOKENS_BY_ID.value),
+                {"page": page_id}):
+            stored[row["text"]] = (row["token"], row["occurrences"])
+            stored_positions[row["text"]] = row["positions"]
+
+        changes: TokenChanges = dict()
+        for token in page_tokens.tokens():
+            previous = stored[token.token_name][1] \
+                if token.token_name in stored else 0
+            if previous != token.token_count:
+                changes[token.token_name] = (previous, token.token_count)
+
+        removed: list[int] = []
+        for text, (token_id, occurrences) in stored.items():
+            if text not in page_tokens:
+                changes[text] = (occurrences, 0)
+                removed.append(token_id)
+
+        # ids are only needed for tokens new to the page
+        token_ids = self.token_ids(
+            cursor, ids, (text for text, (previous, occurrences) in changes.items()
+                          if occurrences and text not in stored))
+        token_ids.update((text, stored[text][0]) for text in changes
+                         if text in stored)
+
+        cursor.executemany(
+            self.db.get_script(config.Config.INSERT_TOKENS_BY_ID.value),
+            ({"page": page_id, "token": token_ids[text],
+              "occurrences": occurrences}
+             for text, (previous, occurrences) in changes.items() if occurrences))
+        cursor.executemany(
+            self.db.get_script(config.Config.DELETE_TOKEN_FROM_PAGE.value),
+            ({"page": page_id, "token": token_id} for token_id in removed))
+
+        if config.Config.STORE_TOKEN_POSITIONS.value:
+            self.write_token_positions(cursor, page_id, page_tokens, token_ids,
+                                       stored, stored_positions, removed)
+
+        if changes:
+            previous_total = sum(occurrences for token_id, occurrences
+                                 in stored.values())
+            self.write_token_statistics(cursor, page_id, token_ids, changes,
+                                        previous_total)
+
+        return changes
+
+    def write_token_positions(self, cursor: sqlite3.Cursor, page_id: int,
+                              page_tokens: TokenContainer,
+                              token_ids: dict[str, int],
+                              stored: dict[str, tuple[int, int]],
+                              stored_positions: dict[str, bytes | None],
+                              removed: list[int]) -> None:
+        """
+        Write the positions of tokens which moved on the page, a token can
+        move without its count changing
+        :param cursor: cursor on the database thread
+        :param page_id: Subdomain id of the page
+        :param page_tokens: tokens found on the page with their positions
+        :param token_ids: ids of the tokens whose counts changed
+        :param stored: ids and counts of the tokens stored before the write
+        :param stored_positions: positions stored before the write
+        :param removed: ids of tokens no longer on the page
+        :return:
+        """
+        rows = []
+        for token in page_tokens.tokens():
+            if token.positions is None:
+                continue
+            positions = encode_positions(sorted(token.positions))
+            if stored_positions.get(token.token_name) == positions:
+                continue
+            token_id = token_ids[token.token_name] \
+                if token.token_name in token_ids else stored[token.token_name][0]
+            rows.append({"page": page_id, "token": token_id,
+                         "positions": positions})
+
+        cursor.executemany(
+            self.db.get_script(config.Config.INSERT_TOKEN_POSITIONS.value), rows)
+        cursor.executemany(
+            self.db.get_script(config.Config.DELETE_TOKEN_POSITIONS.value),
+            ({"page": page_id, "token": token_id} for token_id in removed))
+
+    def write_token_statistics(self, cursor: sqlite3.Cursor, page_id: int,
+                               token_ids: dict[str, int], changes: TokenChanges,
+                               previous_total: int) -> None:
+        """
+        Keep the page length, document frequencies and corpus totals used by
+        BM25 in step with a page's token changes
+        :param cursor: cursor on the database thread
+        :param page_id: Subdomain id of the page
+        :param token_ids: ids of every changed token
+        :param changes: changes made to the page's token counts
+        :param previous_total: tokens on the page before the changes
+        :return:
+        """
+        total = previous_total + sum(occurrences - previous for previous, occurrences
+                                     in changes.values())
+
+        cursor.execute(
+            self.db.get_script(config.Config.UPDATE_PAGE_TOKEN_TOTAL.value),
+            {"page": page_id, "total": total})
+        # only tokens appearing on or disappearing from the page change
+        # their document frequency
+        cursor.executemany(
+            self.db.get_script(config.Config.UPDATE_DOCUMENT_FREQUENCY.value),
+            ({"token": token_ids[text], "change": 1 if occurrences else -1}
+             for text, (previous, occurrences) in changes.items()
+             if not previous or not occurrences))
+        cursor.execute(
+            self.db.get_script(config.Config.UPDATE_CORPUS_STATS.value),
+            {"documents": bool(total) - bool(previous_total),
+             "tokens": total - previous_total})
+
+    def ingest_page(self, link: Subdomain, page_tokens: TokenContainer,
+                    links: dict[Subdomain, int],
+                    text: str | None = None,
+                    html: bytes | None = None) -> TokenChanges:
+        """
+        Insert a fetched page along with its tokens and links as a single
+        transaction in one round trip to the database thread
+        :param link: page that was fetched
+        :param page_tokens: tokens found on the page
+        :param links: links found on the page with their occurrences
+        :param text: text of the page for the full text index and content store
+        :param html: raw html of the page for the content store
+        :return: changes made to the page's token counts
+        """
+        shard = self.db.shard_for(link.domain)
+        changes = shard.transaction(self.write_page, link, page_tokens, links,
+                                    self.get_ids(shard), text, html)
+        log.log(f"Ingested {link} with {len(page_tokens)} tokens "
+                f"and {len(links)} links, {len(changes)} token counts changed")
+        self.notify_token_listeners(link, changes)
+        return changes
+
+    def write_page(self, cursor: sqlite3.Cursor, link: Subdomain,
+                   page_tokens: TokenContainer,
+                   links: dict[Subdomain, int], ids: IdCaches,
+                   text: str | None = None,
+                   html: bytes | None = None) -> TokenChanges:
+        """
+        Write a page to the database, run on the database thread by ingest_page
+        :param cursor: cursor within the page transaction
+        :param link: page that was fetched
+        :param page_tokens: tokens found on the page
+        :param links: links found on the page with their occurrences
+        :param ids: id caches of the shard being written to
+        :param text: text of the page for the full text index and content store
+        :param html: raw html of the page for the content store
+        :return: changes made to the page's token counts
+        """
+        try:
+            page_id = self.page_id(cursor, ids, link)
+
+            changes = self.write_tokens(cursor, ids, page_id, page_tokens)
+
+            if text is not None and self.index_page_text():
+                params = {"page": page_id, "text": text}
+                cursor.execute(
+                    self.db.get_script(config.Config.DELETE_PAGE_TEXT.value),
+                    params)
+                cursor.execute(
+                    self.db.get_script(config.Config.INSERT_PAGE_TEXT.value),
+                    params)
+
+            if text is not None and config.Config.STORE_PAGE_CONTENT.value:
+                self.write_page_content(cursor, page_id, text, html)
+
+            # links
+            cursor.execute(
+                self.db.get_script(config.Config.DELETE_OLD_LINKS_BY_ID.value),
+                {"source": page_id})
+            cursor.executemany(
+                self.db.get_script(config.Config.INSERT_LINKS_BY_ID.value),
+                [{"source": page_id, "target": self.subdomain_id(cursor, ids, target),
+                  "occurrences": occurrences}
+                 for target, occurrences in links.items()])
+
+            return changes
+        except Exception:
+            # ids of rows created in the failed transaction are rolled back
+            ids.clear()
+            raise
+
+    def write_page_content(self, cursor: sqlite3.Cursor, page_id: int,
+                           text: str, html: bytes | None) -> None:
+        """
+        Store the compressed content of a page unless it is unchanged
+        :param cursor: cursor on the database thread
+        :param page_id: Subdomain id of the page
+        :param text: visible text of the page
+        :param html: raw html of the page, None to only keep the text
+        :return:
+        """
+        stored = cursor.execute(
+            self.db.get_script(config.Config.GET_PAGE_CONTENT_HASH.value),
+            {"page": page_id}).fetchone()
+        # pages are compressed once per change rather than once per visit,
+        # html is added to unchanged pages stored before it was being kept
+        if stored is not None \
+                and stored["content_hash"] == contentstore.content_hash(text) \
+                and not (html is not None and stored["html_missing"]):
+            return
+
+        cursor.execute(
+            self.db.get_script(config.Config.INSERT_PAGE_CONTENT.value),
+            contentstore.content_row(page_id, text, html))
+
+    def website_id(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                   url: str) -> int:
+        """
+        Get the id of a website creating it if necessary
+        :param cursor: cursor on the database thread
+        :param ids: id caches of the shard the cursor belongs to
+        :param url: domain of the website
+        :return: Website id
+        """
+        if (website_id := ids.websites.get(url)) is not None:
+            return website_id
+
+        params = {"url": url}
+        cursor.execute(
+            self.db.get_script(config.Config.ENSURE_DOMAIN_EXISTS.value), params)
+        if cursor.rowcount == 1:
+            website_id = cursor.lastrowid
+        else:
+            website_id = cursor.execute(
+                self.db.get_script(config.Config.GET_WEBSITE_ID.value),
+                params).fetchone()["id"]
 
-        if config.Config.EXECUTE_MANY:
-            token_names = page_tokens.token_name_tuples()
-            self.db.execute_many(config.Config.ENSURE_TOKEN_EXISTS.value,
-                            params=token_names)
+        ids.websites.put(url, website_id)
+        return website_id
 
-            token_gen = self.token_generator(site, page_tokens)
-            self.db.execute_many(config.Config.INSERT_MANY_TOKEN.value,
-                            params=token_gen)
+    def subdomain_id(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                     link: Subdomain) -> int:
+        """
+        Get the id of a subdomain creating it if necessary
+        :param cursor: cursor on the database thread
+        :param ids: id caches of the shard the cursor belongs to
+        :param link: subdomain to find
+        :return: Subdomain id
+        """
+        site_id = self.website_id(cursor, ids, link.domain)
+        key = (site_id, link.extension)
+        if (subdomain_id := ids.subdomains.get(key)) is not None:
+            return subdomain_id
+
+        params = {"site_id": site_id, "extension": link.extension}
+        cursor.execute(
+            self.db.get_script(config.Config.ENSURE_SUBDOMAIN_BY_ID.value), params)
+        if cursor.rowcount == 1:
+            subdomain_id = cursor.lastrowid
         else:
-            params: dict[str, Any] = {"extension": site.extension,
-                                      "url": site.domain}
-            for token in page_tokens.tokens():
-                params["token"] = token.token_name
-                params["occurrences"] = token.token_count
-                self.db.execute_script(config.Config.INSERT_TOKEN.value,
-                                  params=params)
+            subdomain_id = cursor.execute(
+                self.db.get_script(config.Config.GET_SUBDOMAIN_ID.value),
+                params).fetchone()["id"]
+
+        ids.subdomains.put(key, subdomain_id)
+        return subdomain_id
+
+    def page_id(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                link: Subdomain) -> int:
+        """
+        Mark a page as checked creating it if necessary, the id of an
+        existing page is kept
+        :param cursor: cursor on the database thread
+        :param ids: id caches of the shard the cursor belongs to
+        :param link: page that was checked
+        :return: Subdomain id
+        """
+        # first lookup of write_page and insert_link
+        ids.check_schema(cursor)
+        site_id = self.website_id(cursor, ids, link.domain)
+        params = {"site_id": site_id, "extension": link.extension,
+                  "checked": self.next_check_date()}
+        page_id = cursor.execute(
+            self.db.get_script(config.Config.UPSERT_PAGE_BY_ID.value),
+            params).fetchone()["id"]
+
+        ids.subdomains.put((site_id, link.extension), page_id)
+        return page_id
+
+    def token_ids(self, cursor: sqlite3.Cursor, ids: IdCaches,
+                  token_names: Iterable[str]) -> dict[str, int]:
+        """
+        Get the ids of tokens creating any that do not exist
+        :param cursor: cursor on the database thread
+        :param ids: id caches of the shard the cursor belongs to
+        :param token_names: text of the tokens
+        :return: dictionary of token text to Token id
+        """
+        token_ids: dict[str, int] = dict()
+        missing: list[str] = []
+        for token_name in token_names:
+            if (token_id := ids.tokens.get(token_name)) is not None:
+                token_ids[token_name] = token_id
+            else:
+                missing.append(token_name)
+
+        if not missing:
+            return token_ids
+
+        cursor.executemany(
+            self.db.get_script(config.Config.ENSURE_TOKEN_EXISTS.value),
+            ({"token": token_name} for token_name in missing))
+
+        get_token_id = self.db.get_script(config.Config.GET_TOKEN_ID.value)
+        for token_name in missing:
+            token_id = cursor.execute(
+                get_token_id, {"token": token_name}).fetchone()["token"]
+            ids.tokens.put(token_name, token_id)
+            token_ids[token_name] = token_id
+
+        return token_ids
 
     @staticmethod
-    def token_generator(site: Subdomain, page_tokens: TokenContainer) -> \
-    Generator[dict[str, Any], None, None]:
-        params: dict[str, Any] = {"extension": site.extension,
-                                  "url": site.domain}
-        for token in page_tokens.tokens():
-            params["token"] = token.token_name
-            params["occurrences"] = token.token_count
-            yield params
+    def next_check_date() -> datetime.datetime:
+        return (datetime.datetime.now()
+                + datetime.timedelta(
+                    days=config.Config.DAYS_TILL_NEXT_PAGE_CHECK.value))
 
     def link_needs_checking(self, link: Subdomain) -> bool:
         """
@@ -145,7 +505,7 @@ class SiteDatabaseHandler:
         :param link: link to verify
         :return: boolean indicating if link needs to be checked
         """
-        link = self.db.execute(
+        link = self.db.shard_for(link.domain).execute(
             config.Config.GET_LINK.value,
             params=(link.domain, link.extension),
             is_file=True
@@ -162,26 +522,8 @@ class SiteDatabaseHandler:
         :param link: link
         :return:
         """
-        next_check_date = (datetime.datetime.now()
-                           + datetime.timedelta(
-                    days=config.Config.DAYS_TILL_NEXT_PAGE_CHECK.value
-                )
-        )
-
-        params = {
-            "url": link.domain,
-            "checked": next_check_date,
-            "extension": link.extension
-        }
-        if sub := self.db.execute(config.Config.CHECK_SUBDOMAIN.value,
-                                  params=params, is_file=True):
-            params["id"] = sub[0]["id"]
-            self.db.execute(config.Config.UPDATE_LINK.value, params=params, is_file=True)
-        else:
-            self.db.execute_script(config.Config.INSERT_LINK.value,
-                params=params)
-
-        id = self.db.execute("SELECT id FROM Subdomain WHERE extension=:extension", params=params)
+        shard = self.db.shard_for(link.domain)
+        id = shard.transaction(self.page_id, self.get_ids(shard), link)
         log.log(f"Inserted {link} into database with id {id}")
 
     def link_recently_checked(self, link: Subdomain) -> bool:
@@ -189,8 +531,8 @@ class SiteDatabaseHandler:
             return False
 
         params = [link.domain, link.extension]
-        check = self.db.execute(config.Config.TIME_CHECK_LINK.value, params=params,
-                           is_file=True)
+        check = self.db.shard_for(link.domain).execute(
+            config.Config.TIME_CHECK_LINK.value, params=params, is_file=True)
 
         if not check:
             return False
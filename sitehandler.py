@@ -7,6 +7,7 @@ from robots import RobotsParser
 
 import requestmanager
 import pagehandler
+import parsepool
 import threadmanager
 from sitedatabasehandler import SiteDatabaseHandler
 from subdomains import Subdomain
@@ -15,7 +16,6 @@ import log
 import queue
 import robots
 import time
-import tokens
 import urllib.robotparser as parser
 from typing import Tuple
 
@@ -126,7 +126,8 @@ class SiteHandler:
 
             # attempt to process url
             try:
-                links, page_tokens = self.process_url(to_handle)
+                page = self.process_url(to_handle)
+                links = page.links
                 log.log(f"fetched links: {links}")
             except AssertionError:
                 log.log(f"failed to fetch links: {to_handle}")
@@ -136,9 +137,8 @@ class SiteHandler:
                 start_time = time.time()
 
             # insert necessary data into database
-            self.db.insert_link(to_handle)
-            self.db.update_tokens(to_handle, page_tokens)
-            self.db.update_links(to_handle, links)
+            self.db.ingest_page(to_handle, page.tokens, links, page.text,
+                                page.html)
 
             if config.Config.TRACK_DATABASE_TIMES.value:
                 # noinspection PyUnboundLocalVariable
@@ -148,8 +148,7 @@ class SiteHandler:
 
             self.queue_handler.queue_links(links)
 
-    def process_url(self, link: Subdomain) -> tuple[
-        dict[Subdomain, int], tokens.TokenContainer]:
+    def process_url(self, link: Subdomain) -> pagehandler.ParsedPage:
         """
         Process url to get tokens and links found on page with checking
         :param link: Link to site
@@ -162,11 +161,11 @@ class SiteHandler:
             f"URL {link} is not allowed by robots.txt"
 
         response = self.get_page(link)
-        soup = pagehandler.get_page_soup(response)
         # TODO write assertion or check for www.robotstxt.org/meta.html meta tags
-        page_tokens = pagehandler.get_tokens_from_soup(soup)
-        links: dict[Subdomain, int] = pagehandler.get_links(soup, parent_url=domain)
-        return links, page_tokens
+        page = parsepool.parse(response.content, parent_url=domain)
+        if config.Config.STORE_PAGE_HTML.value:
+            page = page._replace(html=response.content)
+        return page
 
     def can_check(self, link: Subdomain,) -> bool:
         """
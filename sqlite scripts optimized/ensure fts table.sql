@@ -0,0 +1,6 @@
+-- created on demand as not every sqlite build includes FTS5, the rowid of
+-- each row is the id of the page in Subdomain
+CREATE VIRTUAL TABLE IF NOT EXISTS PageText USING fts5(
+    text,
+    tokenize = 'porter unicode61'
+)
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT OR IGNORE INTO Subdomain
+(site_id, extension)
+VALUES
+(:site_id, :extension)
\ No newline at end of file
@@ -0,0 +1,5 @@
+SELECT
+    document_count,
+    total_tokens
+FROM
+    CorpusStats
\ No newline at end of file
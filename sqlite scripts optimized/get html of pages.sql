@@ -0,0 +1,19 @@
+-- raw html of stored pages for comparing html extractors, see benchmark.py
+SELECT
+    w.url AS domain,
+    pc.compression AS compression,
+    pc.html AS html
+FROM
+    PageContent pc
+INNER JOIN
+    Subdomain s
+ON
+    s.id = pc.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+WHERE
+    pc.html IS NOT NULL
+LIMIT
+    ?
\ No newline at end of file
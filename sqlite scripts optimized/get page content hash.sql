@@ -0,0 +1 @@
+SELECT content_hash, html IS NULL AS html_missing FROM PageContent WHERE page = :page
\ No newline at end of file
@@ -0,0 +1,17 @@
+SELECT
+    t.text,
+    top.token,
+    top.occurrences,
+    tp.positions
+FROM
+    TokenOnPage top
+INNER JOIN
+    Token t
+ON
+    t.token = top.token
+LEFT JOIN
+    TokenPositions tp
+ON
+    tp.page = top.page AND tp.token = top.token
+WHERE
+    top.page = :page
\ No newline at end of file
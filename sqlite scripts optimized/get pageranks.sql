@@ -0,0 +1,12 @@
+SELECT
+    w.url,
+    s.extension,
+    s.pagerank
+FROM
+    Subdomain s
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+WHERE
+    s.pagerank IS NOT NULL
\ No newline at end of file
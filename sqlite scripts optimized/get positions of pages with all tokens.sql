@@ -0,0 +1,39 @@
+WITH query_tokens(token) AS (
+    SELECT token FROM Token WHERE text IN ({token_amount})
+),
+candidates(page) AS (
+    SELECT
+        page
+    FROM
+        TokenOnPage
+    WHERE
+        token IN (SELECT token FROM query_tokens)
+    GROUP BY
+        page
+    HAVING
+        COUNT(*) = ?
+)
+SELECT
+    w.url AS url,
+    s.extension AS extension,
+    s.pagerank AS pagerank,
+    t.text AS text,
+    tp.positions AS positions
+FROM
+    candidates c
+INNER JOIN
+    TokenPositions tp
+ON
+    tp.page = c.page AND tp.token IN (SELECT token FROM query_tokens)
+INNER JOIN
+    Token t
+ON
+    t.token = tp.token
+INNER JOIN
+    Subdomain s
+ON
+    s.id = c.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
\ No newline at end of file
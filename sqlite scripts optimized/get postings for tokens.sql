@@ -0,0 +1,23 @@
+SELECT
+    t.text AS text,
+    w.url AS url,
+    s.extension AS extension,
+    s.pagerank AS pagerank,
+    s.token_total AS token_total,
+    top.occurrences AS occurrences
+FROM
+    Token t
+INNER JOIN
+    TokenOnPage top
+ON
+    top.token = t.token
+INNER JOIN
+    Subdomain s
+ON
+    s.id = top.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+WHERE
+    t.text IN ({token_amount})
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT id FROM Subdomain WHERE site_id=:site_id AND extension=:extension
\ No newline at end of file
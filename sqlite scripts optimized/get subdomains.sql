@@ -1,12 +1,12 @@
 SELECT
-    *,
-    (SELECT url FROM Website WHERE id=site_id) AS url
+    w.url,
+    s.extension
 FROM
-    Subdomain
+    Subdomain s
+INNER JOIN
+    Website w
+ON
+    w.id=s.site_id
 WHERE
-    next_check <> '1970-01-01'
-ORDER BY site_id, extension ASC
-LIMIT
-    ?
-OFFSET
-    ?
\ No newline at end of file
+    s.next_check <> '1970-01-01'
+ORDER BY s.site_id, s.extension ASC
\ No newline at end of file
@@ -0,0 +1,20 @@
+WITH pages(url, extension) AS (VALUES {query_values})
+SELECT
+    p.url AS url,
+    p.extension AS extension,
+    pc.compression AS compression,
+    pc.text AS text
+FROM
+    pages p
+INNER JOIN
+    Website w
+ON
+    w.url = p.url
+INNER JOIN
+    Subdomain s
+ON
+    s.site_id = w.id AND s.extension = p.extension
+INNER JOIN
+    PageContent pc
+ON
+    pc.page = s.id
\ No newline at end of file
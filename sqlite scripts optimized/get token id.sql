@@ -0,0 +1 @@
+SELECT token FROM Token WHERE text=:token
\ No newline at end of file
@@ -0,0 +1,7 @@
+SELECT
+    text,
+    document_frequency
+FROM
+    Token
+WHERE
+    text IN ({token_amount})
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT id FROM Website WHERE url=:url
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT INTO Link
+(source, target, occurrences)
+VALUES
+(:source, :target, :occurrences)
\ No newline at end of file
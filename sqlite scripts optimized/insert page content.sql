@@ -0,0 +1,4 @@
+INSERT OR REPLACE INTO PageContent
+(page, content_hash, compression, text, html)
+VALUES
+(:page, :content_hash, :compression, :text, :html)
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT INTO PageText
+(rowid, text)
+VALUES
+(:page, :text)
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT OR REPLACE INTO TokenPositions
+(page, token, positions)
+VALUES
+(:page, :token, :positions)
\ No newline at end of file
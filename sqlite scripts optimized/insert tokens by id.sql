@@ -0,0 +1,4 @@
+INSERT OR REPLACE INTO TokenOnPage
+(page, token, occurrences)
+VALUES
+(:page, :token, :occurrences)
\ No newline at end of file
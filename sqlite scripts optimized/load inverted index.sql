@@ -0,0 +1,23 @@
+SELECT
+    w.url,
+    s.extension,
+    s.pagerank,
+    s.token_total,
+    t.text,
+    top.occurrences
+FROM
+    TokenOnPage top
+INNER JOIN
+    Subdomain s
+ON
+    s.id = top.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+INNER JOIN
+    Token t
+ON
+    t.token = top.token
+ORDER BY
+    top.page
\ No newline at end of file
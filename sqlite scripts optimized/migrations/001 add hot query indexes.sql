@@ -0,0 +1,4 @@
+-- Token(text) is already covered by the index behind its UNIQUE constraint
+CREATE INDEX IF NOT EXISTS SubdomainNextCheck ON Subdomain(next_check);
+CREATE INDEX IF NOT EXISTS LinkTarget ON Link(target);
+CREATE INDEX IF NOT EXISTS TokenOnPageToken ON TokenOnPage(token);
\ No newline at end of file
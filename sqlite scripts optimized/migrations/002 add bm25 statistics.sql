@@ -0,0 +1,26 @@
+-- statistics for BM25, kept up to date by SiteDatabaseHandler.write_tokens
+ALTER TABLE Subdomain ADD COLUMN token_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE Token ADD COLUMN document_frequency INTEGER NOT NULL DEFAULT 0;
+
+CREATE TABLE CorpusStats(
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    document_count INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL
+);
+
+UPDATE Subdomain SET token_total = (
+    SELECT COALESCE(SUM(top.occurrences), 0)
+    FROM TokenOnPage top
+    WHERE top.page = Subdomain.id
+);
+
+UPDATE Token SET document_frequency = (
+    SELECT COUNT(*)
+    FROM TokenOnPage top
+    WHERE top.token = Token.token
+);
+
+INSERT INTO CorpusStats(id, document_count, total_tokens)
+SELECT 0, COUNT(*), COALESCE(SUM(token_total), 0)
+FROM Subdomain
+WHERE token_total > 0
\ No newline at end of file
@@ -0,0 +1,10 @@
+-- positions of each token on a page encoded by positions.encode_positions,
+-- pages crawled before this migration gain positions when next checked
+CREATE TABLE TokenPositions(
+    page INTEGER NOT NULL,
+    token INTEGER NOT NULL,
+    positions BLOB NOT NULL,
+    FOREIGN KEY (page) REFERENCES Subdomain(id),
+    FOREIGN KEY (token) REFERENCES Token(token),
+    PRIMARY KEY (page, token)
+) WITHOUT ROWID
\ No newline at end of file
@@ -0,0 +1,11 @@
+-- text and optionally raw html of each page compressed with the codec in
+-- compression, see contentstore.py
+CREATE TABLE IF NOT EXISTS PageContent(
+    page INTEGER PRIMARY KEY,
+    content_hash BLOB NOT NULL,
+    compression TEXT NOT NULL,
+    text BLOB NOT NULL,
+    html BLOB,
+    stored DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (page) REFERENCES Subdomain(id)
+)
\ No newline at end of file
@@ -0,0 +1 @@
+SELECT COUNT(*) AS pages FROM PageContent
\ No newline at end of file
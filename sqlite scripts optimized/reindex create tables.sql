@@ -0,0 +1,8 @@
+-- fresh token tables filled by reindex.py then swapped in by
+-- reindex swap tables.sql, created with the current schema of the tables
+-- they replace
+DROP TABLE IF EXISTS TokenNew;
+DROP TABLE IF EXISTS TokenOnPageNew;
+DROP TABLE IF EXISTS TokenPositionsNew;
+
+{create_tables}
@@ -0,0 +1,10 @@
+SELECT
+    page,
+    compression,
+    text
+FROM
+    PageContent
+WHERE
+    page NOT IN (SELECT rowid FROM PageText)
+ORDER BY
+    page
\ No newline at end of file
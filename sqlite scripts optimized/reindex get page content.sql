@@ -0,0 +1,8 @@
+SELECT
+    page,
+    compression,
+    text
+FROM
+    PageContent
+ORDER BY
+    page
\ No newline at end of file
@@ -0,0 +1,14 @@
+-- tables and indexes rebuilt by reindex.py as the migrations left them,
+-- indexes backing constraints have no sql and come with their table
+SELECT
+    type,
+    name,
+    sql
+FROM
+    sqlite_master
+WHERE
+    tbl_name IN ('Token', 'TokenOnPage', 'TokenPositions')
+    AND type IN ('table', 'index')
+    AND sql IS NOT NULL
+ORDER BY
+    type = 'index'
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT INTO TokenOnPageNew
+(page, token, occurrences)
+VALUES
+(?, ?, ?)
\ No newline at end of file
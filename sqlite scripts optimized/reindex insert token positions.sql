@@ -0,0 +1,4 @@
+INSERT INTO TokenPositionsNew
+(page, token, positions)
+VALUES
+(?, ?, ?)
\ No newline at end of file
@@ -0,0 +1,4 @@
+INSERT INTO TokenNew
+(token, text)
+VALUES
+(?, ?)
\ No newline at end of file
@@ -0,0 +1,54 @@
+-- replaces the token tables with the rebuilt ones in a single transaction,
+-- pages without stored content keep their existing tokens
+BEGIN;
+
+INSERT OR IGNORE INTO TokenNew(text)
+SELECT DISTINCT t.text
+FROM TokenOnPage top
+INNER JOIN Token t ON t.token = top.token
+WHERE top.page NOT IN (SELECT page FROM PageContent);
+
+INSERT INTO TokenOnPageNew(page, token, occurrences)
+SELECT top.page, tn.token, top.occurrences
+FROM TokenOnPage top
+INNER JOIN Token t ON t.token = top.token
+INNER JOIN TokenNew tn ON tn.text = t.text
+WHERE top.page NOT IN (SELECT page FROM PageContent);
+
+INSERT INTO TokenPositionsNew(page, token, positions)
+SELECT tp.page, tn.token, tp.positions
+FROM TokenPositions tp
+INNER JOIN Token t ON t.token = tp.token
+INNER JOIN TokenNew tn ON tn.text = t.text
+WHERE tp.page NOT IN (SELECT page FROM PageContent);
+
+DROP TABLE Token;
+DROP TABLE TokenOnPage;
+DROP TABLE TokenPositions;
+
+ALTER TABLE TokenNew RENAME TO Token;
+ALTER TABLE TokenOnPageNew RENAME TO TokenOnPage;
+ALTER TABLE TokenPositionsNew RENAME TO TokenPositions;
+
+-- indexes of the replaced tables, dropped along with them
+{create_indexes}
+
+-- statistics used by bm25 as in migration 002
+UPDATE Subdomain SET token_total = (
+    SELECT COALESCE(SUM(top.occurrences), 0)
+    FROM TokenOnPage top
+    WHERE top.page = Subdomain.id
+);
+
+UPDATE Token SET document_frequency = (
+    SELECT COUNT(*)
+    FROM TokenOnPage top
+    WHERE top.token = Token.token
+);
+
+INSERT OR REPLACE INTO CorpusStats(id, document_count, total_tokens)
+SELECT 0, COUNT(*), COALESCE(SUM(token_total), 0)
+FROM Subdomain
+WHERE token_total > 0;
+
+COMMIT;
\ No newline at end of file
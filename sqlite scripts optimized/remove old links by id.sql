@@ -0,0 +1 @@
+DELETE FROM Link WHERE source=:source
\ No newline at end of file
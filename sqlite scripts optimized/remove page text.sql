@@ -0,0 +1 @@
+DELETE FROM PageText WHERE rowid = :page
\ No newline at end of file
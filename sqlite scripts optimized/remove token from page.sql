@@ -0,0 +1 @@
+DELETE FROM TokenOnPage WHERE page=:page AND token=:token
\ No newline at end of file
@@ -0,0 +1 @@
+DELETE FROM TokenPositions WHERE page=:page AND token=:token
\ No newline at end of file
@@ -0,0 +1,35 @@
+WITH query(text, weight) AS (VALUES {query_values}),
+parameters(k1, b, average_length, pagerank_strength) AS (VALUES (?, ?, ?, ?))
+SELECT
+    w.url AS url,
+    s.extension AS extension,
+    s.pagerank AS pagerank,
+    SUM(q.weight * top.occurrences
+        / (top.occurrences + p.k1 * (1 - p.b + p.b * s.token_total / p.average_length)))
+        * (1 + (COALESCE(s.pagerank, 1) - 1) * p.pagerank_strength) AS query_ranking
+FROM
+    query q
+CROSS JOIN
+    parameters p
+INNER JOIN
+    Token t
+ON
+    t.text = q.text
+INNER JOIN
+    TokenOnPage top
+ON
+    top.token = t.token
+INNER JOIN
+    Subdomain s
+ON
+    s.id = top.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+GROUP BY
+    top.page
+ORDER BY
+    query_ranking DESC
+LIMIT
+    ?
\ No newline at end of file
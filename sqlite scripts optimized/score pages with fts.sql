@@ -0,0 +1,21 @@
+SELECT
+    w.url AS url,
+    s.extension AS extension,
+    s.pagerank AS pagerank,
+    -bm25(PageText) * (1 + (COALESCE(s.pagerank, 1) - 1) * :pagerank_strength) AS query_ranking
+FROM
+    PageText
+INNER JOIN
+    Subdomain s
+ON
+    s.id = PageText.rowid
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+WHERE
+    PageText MATCH :query
+ORDER BY
+    query_ranking DESC
+LIMIT
+    :result_limit
\ No newline at end of file
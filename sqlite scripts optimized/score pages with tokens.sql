@@ -0,0 +1,31 @@
+WITH query(text, weight) AS (VALUES {query_values})
+SELECT
+    w.url AS url,
+    s.extension AS extension,
+    s.pagerank AS pagerank,
+    SUM(top.occurrences * q.weight) * 1.0 / ?
+        * (1 + (COALESCE(s.pagerank, 1) - 1) * ?) AS query_ranking
+FROM
+    query q
+INNER JOIN
+    Token t
+ON
+    t.text = q.text
+INNER JOIN
+    TokenOnPage top
+ON
+    top.token = t.token
+INNER JOIN
+    Subdomain s
+ON
+    s.id = top.page
+INNER JOIN
+    Website w
+ON
+    w.id = s.site_id
+GROUP BY
+    top.page
+ORDER BY
+    query_ranking DESC
+LIMIT
+    ?
\ No newline at end of file
@@ -0,0 +1,4 @@
+UPDATE CorpusStats
+SET
+    document_count = document_count + :documents,
+    total_tokens = total_tokens + :tokens
\ No newline at end of file
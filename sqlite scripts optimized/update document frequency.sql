@@ -0,0 +1,3 @@
+UPDATE Token
+SET document_frequency = document_frequency + :change
+WHERE token = :token
\ No newline at end of file
@@ -0,0 +1,3 @@
+UPDATE Subdomain
+SET token_total = :total
+WHERE id = :page
\ No newline at end of file
@@ -0,0 +1,7 @@
+INSERT INTO Subdomain
+(site_id, extension, next_check)
+VALUES
+(:site_id, :extension, :checked)
+ON CONFLICT (site_id, extension) DO UPDATE
+SET next_check=excluded.next_check
+RETURNING id
\ No newline at end of file
@@ -1,8 +1,16 @@
 import config
-from urllib.parse import urlparse, ParseResult
+import sys
+from urllib.parse import urlparse, urlunparse, ParseResult
 
 class Subdomain:
-    o: ParseResult
+    """
+    Immutable url of a page, the canonical url and its hash are computed
+    once as pages are compared and hashed constantly whilst crawling.
+    Domains are interned as thousands of pages share each one
+    """
+    __slots__ = ("url", "domain", "extension", "_hash", "_o")
+
+    url: str
     domain: str
     extension: str
 
@@ -17,25 +25,55 @@ class Subdomain:
 
     def __init__(self, link: str, parent_url: str | None =None):
         o = urlparse(link)
-        if config.Config.IGNORE_URL_FRAGMENTS.value:
-            o = o._replace(fragment="")
-        self.domain = o.netloc if o.netloc else parent_url
-        self.o = o._replace(netloc=self.domain)._replace(scheme="https")
-        self.extension = o._replace(netloc="")._replace(scheme="").geturl()
-        if not self.extension:
-            self.extension = "/"
-            return
-        if self.extension[0] != "/":
-            self.extension = "/" + self.extension
+        fragment = "" if config.Config.IGNORE_URL_FRAGMENTS.value else o.fragment
+        domain = o.netloc if o.netloc else parent_url
+        url = urlunparse(("https", domain, o.path, o.params, o.query, fragment))
+
+        # the extension is everything after the domain of the url
+        prefix = "https://" + (domain or "")
+        if url.startswith(prefix):
+            extension = url[len(prefix):]
+        else:
+            extension = urlunparse(("", "", o.path, o.params, o.query, fragment))
+        if not extension or extension[0] != "/":
+            extension = "/" + extension
+
+        self._set(url, domain, extension)
+
+    def _set(self, url: str, domain: str | None, extension: str) -> None:
+        self.url = url
+        self.domain = sys.intern(domain) if domain is not None else domain
+        self.extension = extension
+        self._hash = hash(url)
+        self._o = None
+
+    @classmethod
+    def _restore(cls, url: str, domain: str | None, extension: str) -> "Subdomain":
+        subdomain = cls.__new__(cls)
+        subdomain._set(url, domain, extension)
+        return subdomain
+
+    def __reduce__(self):
+        # unpickled without parsing again and with the domain interned in
+        # the receiving process, links come back from parse workers
+        return Subdomain._restore, (self.url, self.domain, self.extension)
+
+    @property
+    def o(self) -> ParseResult:
+        if self._o is None:
+            self._o = urlparse(self.url)
+        return self._o
 
     def get_url(self):
-        return self.o.geturl()
+        return self.url
 
     def __repr__(self):
-        return self.o.geturl()
+        return self.url
 
     def __eq__(self, other):
-        return self.o == other.o
+        if not isinstance(other, Subdomain):
+            return NotImplemented
+        return self.url == other.url
 
     def __hash__(self):
-        return hash(self.o)
\ No newline at end of file
+        return self._hash
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import asyncstorage
+import config
+
+
+@pytest.fixture
+def async_db(database):
+    async_db = asyncstorage.AsyncDatabase(database)
+    yield async_db
+    async_db.close()
+
+
+def test_write_then_read(async_db, monkeypatch):
+    database = async_db.db
+    execute = database.execute
+    threads: list[str] = []
+
+    def record_thread(*args, **kwargs):
+        threads.append(threading.current_thread().name)
+        return execute(*args, **kwargs)
+
+    async def write_then_read() -> list:
+        await async_db.execute(
+            "INSERT INTO Website (url) VALUES ('example.com')")
+        await async_db.commit()
+        monkeypatch.setattr(database, "execute", record_thread)
+        return await async_db.execute("SELECT url FROM Website")
+
+    rows = asyncio.run(write_then_read())
+    assert [row["url"] for row in rows] == ["example.com"]
+    # reads go through the read executor rather than the command thread
+    assert threads and threads[0].startswith("async_reads")
+
+
+def test_iterate_streams_every_row(async_db):
+    async def stream() -> list:
+        await async_db.execute_many(
+            config.Config.ENSURE_DOMAIN_EXISTS.value,
+            ({"url": f"site{i}.com"} for i in range(5)))
+        await async_db.commit()
+        return [row async for row in async_db.iterate(
+            "SELECT url FROM Website ORDER BY url", batch_size=2)]
+
+    assert asyncio.run(stream()) == [(f"site{i}.com",) for i in range(5)]
+
+
+def test_transaction_rolls_back_on_error(async_db):
+    def insert_then_fail(cursor, url: str) -> None:
+        cursor.execute("INSERT INTO Website (url) VALUES (?)", (url,))
+        raise ValueError("abandon the transaction")
+
+    def insert(cursor, url: str) -> int:
+        cursor.execute("INSERT INTO Website (url) VALUES (?)", (url,))
+        return cursor.rowcount
+
+    async def transactions() -> list:
+        with pytest.raises(ValueError):
+            await async_db.transaction(insert_then_fail, "failed.com")
+        assert await async_db.transaction(insert, "kept.com") == 1
+        return await async_db.execute("SELECT url FROM Website")
+
+    rows = asyncio.run(transactions())
+    assert [row["url"] for row in rows] == ["kept.com"]
+
+
+def test_writer_survives_closed_loop(database):
+    async_db = asyncstorage.AsyncDatabase(database)
+
+    async def leave_query_queued() -> None:
+        # keeps the command thread busy so the next query is still queued
+        # when the loop closes
+        async_db.submit(time.sleep, 0.2)
+        async_db.submit(database.commit)
+
+    asyncio.run(leave_query_queued())
+    async_db.close()
+
+    done = threading.Event()
+
+    def write() -> None:
+        database.execute("INSERT INTO Website (url) VALUES ('example.com')")
+        database.commit()
+        done.set()
+
+    threading.Thread(target=write, daemon=True).start()
+    assert done.wait(5), "database command thread stopped"
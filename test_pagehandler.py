@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("nltk")
+
+import pagehandler
+
+# pages the stream extractor must read exactly as BeautifulSoup does
+FIXTURES = {
+    "page": b"""<!DOCTYPE html>
+<html><head><title>Running tests</title>
+<style>p { color: red; }</style>
+<script>var links = "<a href='/hidden'>";</script></head>
+<body>
+  <h1>Search &amp; index</h1>
+  <p>Crawlers <b>fetch</b> pages &mdash; then <i>tokenize</i> them.</p>
+  <a href="/about">About</a> <a href="https://example.com/docs?x=1&amp;y=2">Docs</a>
+  <a>placeholder</a> <a href="/about">About again</a>
+  <!-- a comment with <a href="/commented"> -->
+</body></html>""",
+    "entity without semicolon": b"<p>Hello &lang=en world</p>",
+    "unknown entities": b"<p>&foo; &copy2 &ampx &notit; &notin;</p>",
+    "legacy entities": b"<p>&amp x &lt&gt &nbsp;&copy &acute;</p>",
+    "numeric references": b"<p>&#65 &#x41; &#150; &#x80; &#x81; &#0; &#1; "
+                          b"&#x7f; &#xD800; &#x110000; &#xFDD0; &#x1F600;</p>",
+    "broken references": b"<p>&#12abc &#xZZ &# & trailing &am</p>",
+    "entities in hrefs": b"<a href='/search?q=1&lang=en&amp;page=2'>x</a>",
+    "whitespace strings": b"<p>a</p>\n\n<p>b</p>  <!-- c -->\t<br>\n ",
+    "preserved whitespace": b"<pre>\n\n</pre> <textarea>  </textarea>"
+                            b"<p><pre></p>\t\n <a href='/x'>x</a>",
+    "cdata and declarations": b"<![CDATA[a &amp; b]]><?php echo 1 ?>"
+                              b"<!DOCTYPE html>text&hellip;",
+    "latin-1": b"<meta charset='latin-1'><p>caf\xe9 &#233; &eacute;</p>",
+}
+
+
+@pytest.mark.parametrize("html", FIXTURES.values(), ids=FIXTURES.keys())
+def test_stream_matches_soup(html):
+    soup = pagehandler.parse_page(pagehandler.get_content_soup(html),
+                                  "example.com")
+    stream = pagehandler.parse_stream(html, "example.com")
+
+    assert stream.text == soup.text
+    assert stream.links == soup.links
+    assert stream.tokens.counts == soup.tokens.counts
+    assert stream.tokens.positions == soup.tokens.positions
+
+
+def test_count_page_sends_text_only_when_needed():
+    counts = pagehandler.count_page(FIXTURES["page"], "example.com")
+    page = pagehandler.from_counts(counts)
+
+    expected = pagehandler.parse_content(FIXTURES["page"], "example.com")
+    assert page.tokens.counts == expected.tokens.counts
+    assert page.text == (expected.text if pagehandler.text_needed() else None)
@@ -0,0 +1,30 @@
+import os
+import signal
+
+import pytest
+
+pytest.importorskip("bs4")
+pytest.importorskip("nltk")
+
+import pagehandler
+import parsepool
+
+
+def parses_like_inline(pool: parsepool.ParsePool, content: bytes) -> bool:
+    expected = pagehandler.parse_content(content, "example.com")
+    page = pool.parse(content, "example.com")
+    return page.tokens.counts == expected.tokens.counts
+
+
+def test_parse_survives_dead_worker():
+    pool = parsepool.ParsePool(1, 2)
+    try:
+        assert parses_like_inline(pool, b"<p>before</p>")
+        for pid in list(pool.executor._processes):
+            os.kill(pid, signal.SIGKILL)
+
+        # parsed inline whilst the pool is replaced, then by the new pool
+        assert parses_like_inline(pool, b"<p>during</p>")
+        assert parses_like_inline(pool, b"<p>after</p>")
+    finally:
+        pool.shutdown()
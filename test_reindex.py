@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("nltk")
+
+import contentstore
+import reindex
+from sitedatabasehandler import SiteDatabaseHandler
+from subdomains import Subdomain
+from tokens import TokenContainer
+
+
+def test_crawler_ids_follow_reindex(database):
+    handler = SiteDatabaseHandler(database)
+    handler.ingest_page(Subdomain("https://example.com/zebra"),
+                        TokenContainer(counts={"zebra": 1}), {})
+    yak = Subdomain("https://example.com/yak")
+    handler.ingest_page(yak, TokenContainer(counts={"yak": 1}), {})
+
+    page = database.execute(
+        "SELECT Subdomain.id FROM Subdomain WHERE extension = ?",
+        (yak.extension,))[0]["id"]
+    database.execute(database.get_script("insert page content.sql"),
+                     contentstore.content_row(page, "yak", None))
+    database.commit()
+
+    # pages with content are numbered first so yak takes zebra's old id
+    reindex.reindex(database)
+
+    handler.ingest_page(Subdomain("https://example.com/zebra-again"),
+                        TokenContainer(counts={"zebra": 1}), {})
+    database.commit()
+
+    rows = database.execute(
+        "SELECT Token.text, Token.document_frequency "
+        "FROM Token ORDER BY Token.text")
+    assert [(row["text"], row["document_frequency"]) for row in rows] \
+        == [("yak", 1), ("zebra", 2)]
+
+
+def test_backfill_page_text(database):
+    if not database.execute("SELECT 1 FROM pragma_module_list "
+                            "WHERE name = 'fts5'"):
+        pytest.skip("sqlite built without FTS5")
+    handler = SiteDatabaseHandler(database)
+    page = Subdomain("https://example.com/yak")
+    handler.ingest_page(page, TokenContainer(counts={"yak": 1}), {})
+    page_id = database.execute(
+        "SELECT Subdomain.id FROM Subdomain WHERE extension = ?",
+        (page.extension,))[0]["id"]
+    database.execute(database.get_script("insert page content.sql"),
+                     contentstore.content_row(page_id, "yaks graze", None))
+    database.commit()
+
+    # crawled before fts indexing was turned on so PageText has no row
+    reindex.backfill_page_text(database)
+
+    rows = database.execute(
+        "SELECT rowid FROM PageText WHERE PageText MATCH 'graze'")
+    assert [row["rowid"] for row in rows] == [page_id]
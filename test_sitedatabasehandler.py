@@ -0,0 +1,42 @@
+import sqlite3
+
+import pytest
+
+from sitedatabasehandler import SiteDatabaseHandler
+from subdomains import Subdomain
+from tokens import TokenContainer
+
+
+class FailingCommits(sqlite3.Connection):
+    # commits still to fail, shared by every connection
+    failures = 0
+
+    def commit(self) -> None:
+        if FailingCommits.failures:
+            FailingCommits.failures -= 1
+            raise sqlite3.OperationalError("disk I/O error")
+        super().commit()
+
+
+def test_rolled_back_ids_are_not_reused(open_database):
+    db = open_database(lambda *args, **kwargs: sqlite3.connect(
+        *args, factory=FailingCommits, **kwargs))
+    handler = SiteDatabaseHandler(db)
+    db.commit()
+
+    FailingCommits.failures = 1
+    with pytest.raises(sqlite3.OperationalError):
+        handler.ingest_page(Subdomain("https://example.com/zebra"),
+                            TokenContainer(counts={"zebra": 1}), {})
+
+    handler.ingest_page(Subdomain("https://example.com/yak"),
+                        TokenContainer(counts={"yak": 1, "zebra": 1}), {})
+    db.commit()
+
+    rows = db.execute(
+        "SELECT Token.text, Token.document_frequency, TokenOnPage.page "
+        "FROM TokenOnPage JOIN Token ON Token.token = TokenOnPage.token "
+        "ORDER BY Token.text")
+    assert [(row["text"], row["document_frequency"]) for row in rows] \
+        == [("yak", 1), ("zebra", 1)]
+    assert rows[0]["page"] == rows[1]["page"]
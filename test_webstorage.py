@@ -0,0 +1,8 @@
+def test_failed_classification_is_not_cached(database):
+    query = "SELECT * FROM CreatedLater"
+    # does not compile yet so it is left to the writer
+    assert not database.read_pool.is_read(query)
+
+    database.execute("CREATE TABLE CreatedLater (value INTEGER)")
+    database.commit()
+    assert database.read_pool.is_read(query)
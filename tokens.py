@@ -1,22 +1,51 @@
 from typing import Generator, Tuple
-from nltk.corpus import stopwords
-from nltk import PorterStemmer
-import nltk
+import config
+import functools
+import os
 import re
-import string
 
-stemmer = PorterStemmer()
+# \w only leaves underscores as punctuation within a word
+word_regex = re.compile(r'\w+')
 
-nltk.download('stopwords')
-nltk.download('punkt')
-token_regex_pattern = '|'.join(map(re.escape, string.punctuation))
 
-stopwords = set(stopwords.words('english'))
+def load_stopwords() -> frozenset[str]:
+    """
+    Read the vendored english stopwords so importing never touches the
+    network, falls back to a local copy of nltk's corpus if it is missing
+    :return: stopwords
+    """
+    name = config.Config.OTHER_CONFIG_DIRECTORY.value + os.sep \
+        + config.Config.STOPWORDS_FILE.value
+    try:
+        with open(name, 'r', encoding='utf-8') as file:
+            return frozenset(line.strip() for line in file if line.strip())
+    except FileNotFoundError:
+        from nltk.corpus import stopwords as nltk_stopwords
+        return frozenset(nltk_stopwords.words('english'))
+
+
+@functools.cache
+def stemmer():
+    """
+    nltk is only imported when the first word is stemmed, the porter
+    stemmer needs no downloaded data
+    :return: shared stemmer
+    """
+    from nltk.stem.porter import PorterStemmer
+    return PorterStemmer()
+
+
+stopwords = load_stopwords()
 
 class Token:
-    def __init__(self, token_name: str, token_count: int):
+    __slots__ = ("token_name", "token_count", "positions")
+
+    def __init__(self, token_name: str, token_count: int,
+                 positions: list[int] | None = None):
         self.token_name = token_name
         self.token_count = token_count
+        # word offsets of each occurrence within the text, None if unknown
+        self.positions = positions
 
     def __eq__(self, other):
         if not isinstance(other, Token):
@@ -27,70 +56,94 @@ class Token:
         return hash(self.token_name)
 
 class TokenContainer:
-    def __init__(self, tokens: list[Token] | None = None):
-        if tokens is None:
-            tokens = []
-        self._token_dict = {token.token_name: token for i, token in enumerate(tokens)}
+    """
+    View over the counts of each token and, when known, their positions,
+    Token objects are only created when iterated over with tokens()
+    """
+    __slots__ = ("counts", "positions")
+
+    def __init__(self, tokens: list[Token] | None = None,
+                 counts: dict[str, int] | None = None,
+                 positions: dict[str, list[int]] | None = None):
+        self.counts: dict[str, int] = dict() if counts is None else counts
+        self.positions: dict[str, list[int]] | None = positions
+        for token in tokens or ():
+            self.add_token(token)
 
     def add_token(self, token: Token) -> None:
-        if token.token_name not in self._token_dict:
-            self._token_dict[token.token_name] = token
-        else:
-            self._token_dict[token.token_name].token_count += token.token_count
+        name = token.token_name
+        self.counts[name] = self.counts.get(name, 0) + token.token_count
+        if token.positions is not None:
+            if self.positions is None:
+                self.positions = dict()
+            self.positions.setdefault(name, []).extend(token.positions)
 
     def get_token(self, token_name: str) -> Token:
-        return self._token_dict[token_name]
+        return Token(token_name, self.counts[token_name],
+                     None if self.positions is None
+                     else self.positions.get(token_name))
 
     def tokens(self) -> Generator[Token, None, None]:
-        for token in self._token_dict:
-            yield self._token_dict[token]
+        for token_name in self.counts:
+            yield self.get_token(token_name)
 
     def token_names(self) -> Generator[str, None, None]:
-        for token in self._token_dict:
-            yield token
+        yield from self.counts
 
     def token_name_tuples(self) -> Generator[Tuple[str], None, None]:
-        for token in self._token_dict:
-            yield (token,)
+        for token_name in self.counts:
+            yield (token_name,)
 
     def token_counts(self):
-        for token in self._token_dict:
-            yield self._token_dict[token].token_count
+        yield from self.counts.values()
 
     def total_tokens(self) -> int:
-        return sum(self.token_counts())
+        return sum(self.counts.values())
 
     def get_count(self, token_name: str) -> int:
-        return self._token_dict[token_name].token_count
+        return self.counts[token_name]
 
     def __len__(self):
-        return len(self._token_dict)
+        return len(self.counts)
 
     def __iter__(self):
-        yield from self.token_names()
-
+        yield from self.counts
 
-def get_tokens(text: str) -> TokenContainer:
-    tokens = re.split(r'\W+', text)
-
-    additional_tokens: list[str] = []
-    for token in tokens:
-        if any(char in string.punctuation for char in token):
-            additional_tokens += re.split(token_regex_pattern, token)
-
-    tokens += additional_tokens
+    def __contains__(self, token_name: str):
+        return token_name in self.counts
 
-    final_tokens: TokenContainer = TokenContainer()
 
-    for token in tokens:
-        token = token.lower()
-        token = stemmer.stem(token)
+@functools.lru_cache(maxsize=config.Config.STEM_CACHE_SIZE.value)
+def normalise(word: str) -> str | None:
+    """
+    Stem a lowercase word, cached as the same few words make up most text
+    :param word: lowercase word
+    :return: token of the word or None for stopwords
+    """
+    if word in stopwords:
+        return None
+    token = stemmer().stem(word)
+    if not token or token in stopwords:
+        return None
+    return token
 
-        if token in stopwords or not token:
-            continue
 
-        token = Token(token, 1)
-
-        final_tokens.add_token(token)
-
-    return final_tokens
+def get_tokens(text: str) -> TokenContainer:
+    counts: dict[str, int] = dict()
+    positions: dict[str, list[int]] = dict()
+
+    # stopwords keep their positions so phrases line up with queries
+    for position, word in enumerate(word_regex.findall(text.lower())):
+        # underscore compounds count as the whole word and each part
+        words = [word, *word.split("_")] if "_" in word else (word,)
+        for word in words:
+            if (token := normalise(word)) is None:
+                continue
+            if token in counts:
+                counts[token] += 1
+                positions[token].append(position)
+            else:
+                counts[token] = 1
+                positions[token] = [position]
+
+    return TokenContainer(counts=counts, positions=positions)
@@ -12,15 +12,16 @@ from subdomains import Subdomain
 import sitedatabasehandler
 import sitehandler
 import pagerank
+import parsepool
 
-db: None | webstorage.Database= None
+db: None | webstorage.Database | webstorage.ShardedDatabase = None
 db_handler : None | sitedatabasehandler.SiteDatabaseHandler = None
 
 thread_manager : None | threadmanager.ThreadManager = threadmanager.ThreadManager()
 queues : None | threadmanager.QueueContainer = None
 
 
-def set_db(database: webstorage.Database):
+def set_db(database: webstorage.Database | webstorage.ShardedDatabase):
     global db, db_handler, queues
     db = database
     db_handler = sitedatabasehandler.SiteDatabaseHandler(database)
@@ -29,11 +30,14 @@ def set_db(database: webstorage.Database):
 def old_links_daemon() -> None:
     while True:
         try:
-            urls_to_check = db.execute(config.Config.FIND_OLD_LINKS.value,
-                                       is_file=True)
+            urls_to_check: dict[Subdomain, int] = dict()
+            for (link,) in db.iterate(config.Config.FIND_OLD_LINKS.value,
+                                      is_file=True):
+                urls_to_check[Subdomain(link)] = 0
 
-            urls_to_check = {
-                Subdomain(subdomain["link"]): 0 for subdomain in urls_to_check}
+                if len(urls_to_check) >= config.Config.ITERATE_BATCH_SIZE.value:
+                    queues.queue_links(urls_to_check)
+                    urls_to_check = dict()
 
             queues.queue_links(urls_to_check)
 
@@ -59,9 +63,7 @@ def start_scraping() -> None:
 
 
 if __name__ == "__main__":
-    _db = webstorage.Database(config.Config.DATABASE_NAME.value,
-                         config.Config.INIT_SCRIPT.value,
-                         script_directory=config.Config.SCRIPT_FOLDER.value,)
+    _db = webstorage.open_database()
 
     requestmanager.RequestManager.set_default_period(
         datetime.timedelta(
@@ -75,8 +77,22 @@ if __name__ == "__main__":
             seconds=config.Config.GLOBAL_REQUEST_INTERVAL_SECONDS.value),
     )
 
+    # workers are started before any fetch thread so they are ready for
+    # the first pages
+    if config.Config.PARSE_IN_PROCESSES.value:
+        parsepool.start()
+
     set_db(_db)
+    websearch.set_db(_db)
+
+    # keep the search index and cached results current whilst crawling,
+    # the index is updated before cached results are invalidated
+    if websearch.index is not None:
+        db_handler.token_listeners.append(websearch.index.update_page)
+        pagerank.rank_listeners.append(websearch.index.refresh_pageranks)
+    db_handler.token_listeners.append(websearch.result_cache.invalidate)
+    pagerank.rank_listeners.append(websearch.result_cache.invalidate)
+
     start_scraping()
     pagerank.set_db(_db)
     pagerank.start_pagerank()
-    websearch.set_db(_db)
@@ -1,67 +1,556 @@
+import contentstore
+import heapq
+import positions
+import ranking
+import re
 import tokens
 import webstorage
 import config
+from invertedindex import InvertedIndex
+from resultcache import ResultCache
 from tokens import TokenContainer
 from typing import Any
 
-db : webstorage.Database | None = None
+db : webstorage.Database | webstorage.ShardedDatabase | None = None
+index : InvertedIndex | None = None
+result_cache = ResultCache(config.Config.RESULT_CACHE_SIZE.value,
+                           config.Config.RESULT_CACHE_MAX_AGE_SECONDS.value)
 
-def set_db(database: webstorage.Database):
-    global db
+# "exact phrase" or "nearby words"~slop
+PHRASE_QUERY = re.compile(r'^\s*"(.+)"(?:~(\d+))?\s*$')
+
+def set_db(database: webstorage.Database | webstorage.ShardedDatabase):
+    global db, index
     db = database
+    result_cache.invalidate()
+
+    if config.Config.SEARCH_BACKEND.value == "fts5":
+        # bm25() uses the statistics of its own shard so scores from
+        # different shards cannot be merged
+        assert not isinstance(database, webstorage.ShardedDatabase), \
+            "The fts5 search backend needs a single database shard"
+        db.execute_script(config.Config.ENSURE_FTS_TABLE.value)
+
+    if config.Config.IN_MEMORY_INDEX.value:
+        index = InvertedIndex(database)
+        index.load()
+
+def reload_index() -> None:
+    """
+    Replace the in memory index with a fresh copy of the database, searches
+    keep using the old index until the new one has loaded
+    :return:
+    """
+    global index
+    if config.Config.IN_MEMORY_INDEX.value:
+        fresh = InvertedIndex(db)
+        fresh.load()
+        index = fresh
+    result_cache.invalidate()
 
 def search_for(query: str) -> list[str]:
-    query_tokens = tokens.get_tokens(query)
-    subdomains = get_subdomains_featuring(query_tokens,
-        config.Config.RESULTS_PER_SEARCH.value)
-    apply_token_rating(subdomains, query_tokens)
-    sorted_subdomains = sorted(
-        subdomains, key=lambda subdomain: subdomain['query_ranking'] ,
-        reverse=True)
+    subdomains = search_results(query, config.Config.RESULTS_PER_SEARCH.value)
     just_subdomains = [subdomain['url'] + subdomain['extension']
-                       for subdomain in sorted_subdomains]
+                       for subdomain in subdomains]
     return just_subdomains
 
-def get_subdomains_featuring(query_tokens: TokenContainer,
-                             pagerank_cutoff_count: int) -> list[dict[str, Any]]:
-    # possibly expensive
-    params: list[Any] = list(query_tokens.token_names()) # + [pagerank_cutoff_count,]
+def search_with_snippets(query: str) -> list[dict[str, str | None]]:
+    """
+    Search for a query and include the passage of each page best matching
+    it, snippets need store page content enabled whilst crawling
+    :param query: query to search for
+    :return: url and snippet of each result, snippet is None for pages
+    without stored content
+    """
+    subdomains = add_snippets(
+        search_results(query, config.Config.RESULTS_PER_SEARCH.value), query)
+    return [{"url": subdomain['url'] + subdomain['extension'],
+             "snippet": subdomain['snippet']}
+            for subdomain in subdomains]
+
+def add_snippets(subdomains: list[dict[str, Any]],
+                 query: str) -> list[dict[str, Any]]:
+    """
+    Copy search results adding a snippet of each page from the content store
+    :param subdomains: results from search_results
+    :param query: query the results are for
+    :return: results with a snippet key
+    """
+    if not subdomains:
+        return []
+
+    sql_query = db.render_script(config.Config.GET_TEXT_OF_PAGES.value,
+                                 query_values=len(subdomains))
+    params: list[str] = []
+    for subdomain in subdomains:
+        params += [subdomain['url'], subdomain['extension']]
+
+    texts = {(row["url"], row["extension"]):
+                 contentstore.read_text(row["text"], row["compression"])
+             for row in db.execute(sql_query, params=params, is_file=False)}
+
+    if (phrase := PHRASE_QUERY.match(query)) is not None:
+        query = phrase.group(1)
+    query_tokens = set(tokens.get_tokens(query).token_names())
+
+    return [dict(subdomain, snippet=make_snippet(
+                texts.get((subdomain['url'], subdomain['extension'])),
+                query_tokens, config.Config.SNIPPET_WORDS.value))
+            for subdomain in subdomains]
+
+def make_snippet(text: str | None, query_tokens: set[str],
+                 length: int) -> str | None:
+    """
+    Find the run of words in a text containing the most distinct query tokens
+    :param text: text of the page
+    :param query_tokens: stemmed tokens of the query
+    :param length: words in the snippet
+    :return: the passage with ... where the text was cut
+    """
+    if text is None:
+        return None
+
+    words = list(re.finditer(r'\w+', text))
+    if not words:
+        return ""
+
+    stems: dict[str, str | None] = dict()
+    hits: list[str | None] = []
+    for word in words:
+        lowered = word.group().lower()
+        if lowered not in stems:
+            stem = tokens.normalise(lowered)
+            stems[lowered] = stem if stem in query_tokens else None
+        hits.append(stems[lowered])
+
+    # slide a window of length words counting the query tokens within it
+    counts: dict[str, int] = dict()
+    best_start, best_score = 0, -1
+    for end, hit in enumerate(hits):
+        if hit is not None:
+            counts[hit] = counts.get(hit, 0) + 1
+        start = end - length + 1
+        if start > 0 and (dropped := hits[start - 1]) is not None:
+            counts[dropped] -= 1
+            if not counts[dropped]:
+                del counts[dropped]
+        if start >= 0 and len(counts) > best_score:
+            best_start, best_score = start, len(counts)
+    if best_score < 0:  # text shorter than a snippet
+        best_start = 0
 
-    sql_query = db.get_script(config.Config.GET_QUERY_SUBDOMAINS.value)
+    # centre the window on the query tokens it contains
+    window_hits = [i for i in range(best_start, min(best_start + length, len(words)))
+                   if hits[i] is not None]
+    if window_hits:
+        spare = length - (window_hits[-1] - window_hits[0] + 1)
+        best_start = max(0, min(window_hits[0] - spare // 2,
+                                len(words) - length))
 
-    sql_query = sql_query.format(
-        token_amount = ",".join(["?"] * len(query_tokens)),
-    )
+    last = min(best_start + length, len(words)) - 1
+    snippet = " ".join(text[words[best_start].start():words[last].end()].split())
+    if best_start > 0:
+        snippet = "..." + snippet
+    if last < len(words) - 1:
+        snippet += "..."
+    return snippet
 
-    subdomains = db.execute(sql_query,
-        params=params, is_file=False)
+def search_results(query: str, result_limit: int) -> list[dict[str, Any]]:
+    """
+    Get the best pages for a query with the configured backend
+    :param query: query, "..." for phrases and "..."~n for proximity
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    if config.Config.SEARCH_BACKEND.value == "fts5":
+        return search_fts(query, result_limit)
 
+    if (phrase := PHRASE_QUERY.match(query)) is not None:
+        return search_phrase(phrase.group(1), int(phrase.group(2) or 0),
+                             result_limit)
+
+    query_tokens = tokens.get_tokens(query)
+    if not len(query_tokens):
+        return []
+    return search_subdomains(query_tokens, result_limit)
+
+def search_subdomains(query_tokens: TokenContainer,
+                      result_limit: int) -> list[dict[str, Any]]:
+    """
+    Get the best pages for a query from the result cache, the in memory
+    index or the database
+    :param query_tokens: tokens of the query
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    key = ResultCache.key(query_tokens, result_limit)
+    generation = result_cache.generation
+    if (subdomains := result_cache.get(key)) is not None:
+        return subdomains
+
+    if index is not None:
+        subdomains = index.search(query_tokens.counts, result_limit)
+    else:
+        subdomains = score_subdomains(query_tokens, result_limit)
+
+    result_cache.put(key, subdomains, generation)
+    return subdomains
+
+def fts_match_expression(query: str) -> str:
+    """
+    Convert a query to an FTS5 MATCH expression, words are quoted so
+    characters with a meaning to FTS5 are searched for literally
+    :param query: query as given to search_for
+    :return: expression matching any word, or the phrase of a phrase query
+    """
+    phrase = PHRASE_QUERY.match(query)
+    words = re.findall(r'\w+', phrase.group(1) if phrase else query)
+    if not words:
+        return ""
+    if phrase is None:
+        return " OR ".join(f'"{word}"' for word in words)
+    if phrase.group(2) is None:
+        return '"' + " ".join(words) + '"'
+    quoted_words = " ".join(f'"{word}"' for word in words)
+    return f"NEAR({quoted_words}, {int(phrase.group(2))})"
+
+def search_fts(query: str, result_limit: int) -> list[dict[str, Any]]:
+    """
+    Get the best pages for a query from the FTS5 index using its bm25
+    ranking blended with pagerank in the same way as the token scripts
+    :param query: query as given to search_for
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    expression = fts_match_expression(query)
+    if not expression:
+        return []
+
+    key = ("fts", expression, result_limit)
+    generation = result_cache.generation
+    if (subdomains := result_cache.get(key)) is not None:
+        return subdomains
+
+    subdomains = score_subdomains_fts(expression, result_limit)
+    result_cache.put(key, subdomains, generation)
     return subdomains
 
-def apply_token_rating(subdomains: list[dict[str, Any]],
-                       query_tokens: TokenContainer) -> None:
-    total_tokens = query_tokens.total_tokens()
+def score_subdomains_fts(expression: str,
+                         result_limit: int) -> list[dict[str, Any]]:
+    """
+    Score pages with FTS5, only for a single database as bm25() is
+    computed from the statistics of one shard
+    :param expression: FTS5 MATCH expression
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    subdomains = db.execute(
+        config.Config.SCORE_QUERY_SUBDOMAINS_FTS.value,
+        params={"query": expression,
+                "pagerank_strength": config.Config.PAGE_RANK_STRENGTH.value,
+                "result_limit": result_limit},
+        is_file=True)
+
+    return sorted(subdomains, key=lambda subdomain: subdomain['query_ranking'],
+                  reverse=True)[:result_limit]
+
+def search_phrase(text: str, slop: int,
+                  result_limit: int) -> list[dict[str, Any]]:
+    """
+    Find pages containing the words of text next to each other, or with a
+    slop above 0 all within slop words of the phrase's length in any order.
+    Only pages containing every token are read and their stored positions
+    are intersected, pages are ranked by matches and pagerank
+    :param text: phrase to search for
+    :param slop: extra words allowed between the words of the phrase
+    :param result_limit: maximum number of pages to return
+    :return: best pages with their query_ranking, best first
+    """
+    query_tokens = tokens.get_tokens(text)
+    if not len(query_tokens):
+        return []
+
+    # stopwords are not stored but keep their place in the offsets
+    sequence = sorted((position, token.token_name)
+                      for token in query_tokens.tokens()
+                      for position in token.positions)
+    key = ResultCache.key(query_tokens, result_limit, "phrase", slop,
+                          tuple(sequence))
+    generation = result_cache.generation
+    if (subdomains := result_cache.get(key)) is not None:
+        return subdomains
+
+    token_names = list(query_tokens.token_names())
+    sql_query = db.render_script(config.Config.GET_PHRASE_CANDIDATES.value,
+                                 token_amount=len(token_names))
+
+    pages: dict[tuple[str, str], tuple[float | None, dict[str, list[int]]]] = dict()
+    for url, extension, pagerank, token_name, encoded in db.iterate(
+            sql_query, params=token_names + [len(token_names)]):
+        page = pages.setdefault((url, extension), (pagerank, dict()))
+        page[1][token_name] = positions.decode_positions(encoded)
+
+    window = sequence[-1][0] - sequence[0][0] + slop
+    strength = config.Config.PAGE_RANK_STRENGTH.value
+    subdomains = []
+    for (url, extension), (pagerank, page_positions) in pages.items():
+        # pages crawled before positions were stored
+        if len(page_positions) != len(token_names):
+            continue
+        if slop:
+            matches = positions.proximity_matches(set(token_names),
+                                                  page_positions, window)
+        else:
+            matches = positions.phrase_matches(sequence, page_positions)
+        if not matches:
+            continue
+        boost = 1 + ((1 if pagerank is None else pagerank) - 1) * strength
+        subdomains.append({"url": url, "extension": extension,
+                           "pagerank": pagerank,
+                           "query_ranking": matches * boost})
+
+    subdomains = heapq.nlargest(result_limit, subdomains,
+                                key=lambda subdomain: subdomain['query_ranking'])
+    result_cache.put(key, subdomains, generation)
+    return subdomains
+
+def search_many(queries: list[str]) -> list[list[str]]:
+    """
+    Search for several queries at once, see search_results_many
+    :param queries: queries to search for
+    :return: result urls of each query in the order of the queries
+    """
+    all_subdomains = search_results_many(
+        queries, config.Config.RESULTS_PER_SEARCH.value)
+    return [[subdomain['url'] + subdomain['extension']
+             for subdomain in subdomains]
+            for subdomains in all_subdomains]
+
+def search_results_many(queries: list[str],
+                        result_limit: int) -> list[list[dict[str, Any]]]:
+    """
+    Get the best pages for several queries, plain queries are scored
+    together by search_subdomains_many
+    :param queries: queries to search for
+    :param result_limit: maximum number of pages to return for each query
+    :return: best scoring pages of each query in the order of the queries
+    """
+    # FTS5 and phrases answer each query with their own index lookups
+    if config.Config.SEARCH_BACKEND.value == "fts5":
+        return [search_results(query, result_limit) for query in queries]
+
+    results: list[list[dict[str, Any]] | None] = [None] * len(queries)
+    plain: list[int] = []
+    for i, query in enumerate(queries):
+        if PHRASE_QUERY.match(query) is not None:
+            results[i] = search_results(query, result_limit)
+        else:
+            plain.append(i)
+
+    all_subdomains = search_subdomains_many(
+        [tokens.get_tokens(queries[i]) for i in plain], result_limit)
+    for i, subdomains in zip(plain, all_subdomains):
+        results[i] = subdomains
+    return results
+
+def search_subdomains_many(all_query_tokens: list[TokenContainer],
+                           result_limit: int) -> list[list[dict[str, Any]]]:
+    """
+    Get the best pages for several queries. Queries missing from the result
+    cache share a single fetch of the postings of every token they contain
+    and are then scored in Python so the number of database round trips
+    does not grow with the number of queries
+    :param all_query_tokens: tokens of each query
+    :param result_limit: maximum number of pages to return for each query
+    :return: best scoring pages of each query in the order of the queries
+    """
+    generation = result_cache.generation
+    results: list[list[dict[str, Any]] | None] = [None] * len(all_query_tokens)
+    misses: list[int] = []
+    for i, query_tokens in enumerate(all_query_tokens):
+        if not len(query_tokens):
+            results[i] = []
+        elif (subdomains := result_cache.get(
+                ResultCache.key(query_tokens, result_limit))) is not None:
+            results[i] = subdomains
+        else:
+            misses.append(i)
+
+    if misses and index is not None:
+        for i in misses:
+            results[i] = index.search(all_query_tokens[i].counts,
+                                      result_limit)
+    elif misses:
+        token_names = list({token_name for i in misses
+                            for token_name in all_query_tokens[i].counts})
+        postings, pages = fetch_postings(token_names)
+        statistics = corpus_statistics() \
+            if config.Config.SEARCH_RANKING.value == "bm25" else (0, 0)
+        for i in misses:
+            results[i] = score_postings(all_query_tokens[i], postings, pages,
+                                        statistics, result_limit)
+
+    for i in misses:
+        result_cache.put(ResultCache.key(all_query_tokens[i], result_limit),
+                         results[i], generation)
+    return results
+
+# page (url, extension) -> (pagerank, token total)
+PageInfo = dict[tuple[str, str], tuple[float | None, int]]
+
+def fetch_postings(token_names: list[str]) -> \
+        tuple[dict[str, list[tuple[tuple[str, str], int]]], PageInfo]:
+    """
+    Read every page containing any of the tokens, pages are identified by
+    url so rows from different shards can be combined
+    :param token_names: text of the tokens
+    :return: token text -> (page, occurrences) and information on each page
+    """
+    postings: dict[str, list[tuple[tuple[str, str], int]]] = {
+        token_name: [] for token_name in token_names}
+    pages: PageInfo = dict()
+
+    chunk_size = config.Config.SEARCH_BATCH_TOKENS.value
+    for start in range(0, len(token_names), chunk_size):
+        chunk = token_names[start:start + chunk_size]
+        sql_query = db.render_script(
+            config.Config.GET_POSTINGS_FOR_TOKENS.value,
+            token_amount=len(chunk))
+        for text, url, extension, pagerank, token_total, occurrences \
+                in db.iterate(sql_query, params=chunk):
+            page = (url, extension)
+            postings[text].append((page, occurrences))
+            pages[page] = (pagerank, token_total)
+
+    return postings, pages
+
+def score_postings(query_tokens: TokenContainer,
+                   postings: dict[str, list[tuple[tuple[str, str], int]]],
+                   pages: PageInfo, statistics: tuple[int, int],
+                   result_limit: int) -> list[dict[str, Any]]:
+    """
+    Score a query from fetched postings the same way as the scoring scripts
+    :param query_tokens: tokens of the query
+    :param postings: postings of at least every token in the query
+    :param pages: pagerank and token total of every page in the postings
+    :param statistics: document count and total tokens, used by bm25
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    bm25 = config.Config.SEARCH_RANKING.value == "bm25"
+    strength = config.Config.PAGE_RANK_STRENGTH.value
+    document_count, total_tokens = statistics
+    average_page_length = ranking.average_length(document_count, total_tokens)
+
+    scores: dict[tuple[str, str], float] = dict()
+    for token in query_tokens.tokens():
+        token_postings = postings[token.token_name]
+        if bm25:
+            weight = ranking.bm25_weight(token.token_count, document_count,
+                                         len(token_postings))
+            for page, occurrences in token_postings:
+                norm = ranking.bm25_norm(pages[page][1], average_page_length)
+                scores[page] = (scores.get(page, 0)
+                                + weight * occurrences / (occurrences + norm))
+        else:
+            for page, occurrences in token_postings:
+                scores[page] = (scores.get(page, 0)
+                                + occurrences * token.token_count)
+
+    divisor = 1 if bm25 else query_tokens.total_tokens()
+    subdomains = []
+    for page, score in scores.items():
+        pagerank = pages[page][0]
+        boost = 1 + ((1 if pagerank is None else pagerank) - 1) * strength
+        subdomains.append({"url": page[0], "extension": page[1],
+                           "pagerank": pagerank,
+                           "query_ranking": score / divisor * boost})
+
+    return heapq.nlargest(result_limit, subdomains,
+                          key=lambda subdomain: subdomain['query_ranking'])
+
+def score_subdomains(query_tokens: TokenContainer,
+                     result_limit: int) -> list[dict[str, Any]]:
+    """
+    Score pages containing the query tokens in a single query, only the
+    TokenOnPage rows of the query's tokens are read
+    :param query_tokens: tokens of the query
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    if config.Config.SEARCH_RANKING.value == "bm25":
+        return score_subdomains_bm25(query_tokens, result_limit)
+
+    sql_query = db.render_script(config.Config.SCORE_QUERY_SUBDOMAINS.value,
+                                 query_values=len(query_tokens))
+
+    params: list[Any] = []
+    for token in query_tokens.tokens():
+        params += [token.token_name, token.token_count]
+    params += [query_tokens.total_tokens(),
+               config.Config.PAGE_RANK_STRENGTH.value,
+               result_limit]
+
+    subdomains = db.execute(sql_query, params=params, is_file=False)
+
+    # a sharded database returns the best pages of every shard
+    return sorted(subdomains, key=lambda subdomain: subdomain['query_ranking'],
+                  reverse=True)[:result_limit]
+
+def score_subdomains_bm25(query_tokens: TokenContainer,
+                          result_limit: int) -> list[dict[str, Any]]:
+    """
+    Score pages containing the query tokens with BM25, the statistics are
+    read from the maintained totals so only the query's tokens are looked up
+    :param query_tokens: tokens of the query
+    :param result_limit: maximum number of pages to return
+    :return: best scoring pages with their query_ranking, best first
+    """
+    document_count, total_tokens = corpus_statistics()
+    frequencies = document_frequencies(
+        [token.token_name for token in query_tokens.tokens()])
+
+    sql_query = db.render_script(
+        config.Config.SCORE_QUERY_SUBDOMAINS_BM25.value,
+        query_values=len(query_tokens))
+
+    params: list[Any] = []
+    for token in query_tokens.tokens():
+        params += [token.token_name,
+                   ranking.bm25_weight(token.token_count, document_count,
+                                       frequencies.get(token.token_name, 0))]
+    params += [config.Config.BM25_K1.value,
+               config.Config.BM25_B.value,
+               ranking.average_length(document_count, total_tokens),
+               config.Config.PAGE_RANK_STRENGTH.value,
+               result_limit]
 
-    for i, subdomain in enumerate(subdomains):
-        token_rank = 0
-        page_tokens = get_subdomain_tokens(subdomain)
-        for token, count in page_tokens.items():
-            if token not in query_tokens:
-                continue
-            token_rank += count * query_tokens.get_count(token)
-        token_rank /= total_tokens
-        subdomains[i]['query_ranking'] = token_rank * (1 + (subdomain['pagerank'] - 1) * config.Config.PAGE_RANK_STRENGTH.value)
+    subdomains = db.execute(sql_query, params=params, is_file=False)
 
-def get_subdomain_tokens(subdomain: dict[str, Any]) -> dict[str, int]:
-    params = {
-        "url": subdomain["url"],
-        "extension": subdomain["extension"],
-    }
+    return sorted(subdomains, key=lambda subdomain: subdomain['query_ranking'],
+                  reverse=True)[:result_limit]
 
-    token_list = db.execute(config.Config.GET_SUBDOMAIN_TOKENS.value, params=params,
-               is_file=True)
+def corpus_statistics() -> tuple[int, int]:
+    """
+    :return: pages with tokens and tokens across every page
+    """
+    # summed as a sharded database returns one row per shard
+    rows = db.execute(config.Config.GET_CORPUS_STATS.value, is_file=True)
+    return (sum(row["document_count"] for row in rows),
+            sum(row["total_tokens"] for row in rows))
 
-    return {token["token"]: token["occurrences"] for token in token_list}
+def document_frequencies(token_names: list[str]) -> dict[str, int]:
+    """
+    :param token_names: text of the tokens
+    :return: number of pages each token appears on
+    """
+    sql_query = db.render_script(config.Config.GET_TOKEN_STATISTICS.value,
+                                 token_amount=len(token_names))
+    frequencies: dict[str, int] = dict()
+    for row in db.execute(sql_query, params=token_names, is_file=False):
+        frequencies[row["text"]] = (frequencies.get(row["text"], 0)
+                                    + row["document_frequency"])
+    return frequencies
 
 
 def search_loop():
@@ -69,8 +558,6 @@ def search_loop():
         print(search_for(input("Search query: ")))
 
 if __name__ == "__main__":
-    _db = webstorage.Database(config.Config.DATABASE_NAME.value,
-                              config.Config.INIT_SCRIPT.value,
-                              script_directory=config.Config.SCRIPT_FOLDER.value, )
+    _db = webstorage.open_database()
     set_db(_db)
-    search_loop()
\ No newline at end of file
+    search_loop()
@@ -1,14 +1,22 @@
+import concurrent.futures
+import contextlib
+import itertools
 import sqlite3
 import threading
 import inspect
 import time
+import pathlib
+import re
 
 import config
-from typing import Callable, Iterable, Any
+from typing import Callable, Iterable, Any, Generator
 import os
 import hashlib
 import log
 import queue
+import zlib
+from idcache import LRUCache
+from scriptregistry import ScriptRegistry
 
 def dict_factory(cursor, row):
     d = {}
@@ -16,16 +24,170 @@ def dict_factory(cursor, row):
         d[col[0]] = row[idx]
     return d
 
+# row factories available to Database.iterate, tuples are built in C
+ROW_FACTORIES: dict[str, Callable | None] = {
+    "tuple": None,
+    "row": sqlite3.Row,
+    "dict": dict_factory,
+}
+
+# whitespace and comments before the first keyword of a statement
+LEADING_COMMENTS = re.compile(r'(?:\s+|--[^\n]*(?:\n|$)|/\*.*?(?:\*/|$))*', re.S)
+FIRST_KEYWORD = re.compile(r'[A-Za-z]+')
+
+# statements starting with these may only read, see ConnectionPool.is_read
+READ_KEYWORDS = frozenset(("SELECT", "WITH", "VALUES"))
+
+# opcodes of a prepared statement that write, Transaction only writes when
+# its second operand is set
+WRITE_OPCODES = frozenset(("VUpdate", "OpenWrite"))
+
+def is_read_query(sql_script: str) -> bool:
+    """
+    Check if a query may only read from the database by its first keyword
+    after any comments, WITH can still start a write which is checked by
+    ConnectionPool.is_read
+    :param sql_script: sql to be checked
+    :return: boolean indicating if query could be given to a read connection
+    """
+    keyword = FIRST_KEYWORD.match(
+        sql_script, LEADING_COMMENTS.match(sql_script).end())
+    return keyword is not None and keyword.group().upper() in READ_KEYWORDS
+
+def is_read_only_statement(conn: sqlite3.Connection, sql_script: str,
+                           params=()) -> bool | None:
+    """
+    Check a statement by the program sqlite compiles it to, the same
+    test as sqlite3_stmt_readonly which the sqlite3 module does not expose
+    :param conn: connection to compile the statement on
+    :param sql_script: a single statement
+    :param params: parameters of the statement, only needed for binding
+    :return: boolean indicating if the statement never writes, None if it
+    could not be compiled
+    """
+    try:
+        program = conn.execute("EXPLAIN " + sql_script, params).fetchall()
+    except sqlite3.Error:
+        # possibly only whilst the schema is locked or being changed
+        return None
+    for instruction in program:
+        if instruction["opcode"] in WRITE_OPCODES:
+            return False
+        if instruction["opcode"] == "Transaction" and instruction["p2"]:
+            return False
+    return True
+
+class ConnectionPool:
+    """
+    Bounded pool of read only connections allowing SELECT queries to run
+    alongside the writer thread when the database is in WAL mode
+    """
+    def __init__(self, database: str, size: int,
+                 connect_function = sqlite3.connect) -> None:
+        # pathlib rather than urllib.request which pulls in http and email
+        uri = pathlib.Path(os.path.abspath(database)).as_uri() + "?mode=ro"
+        self.uri = uri
+        self.connect_function = connect_function
+        self.connections: queue.Queue[sqlite3.Connection] = queue.Queue(
+            maxsize=size)
+        for _ in range(size):
+            self.connections.put(self.connect(uri, connect_function))
+        # sql text -> whether it only reads
+        self.read_queries = LRUCache(
+            config.Config.CLASSIFIED_QUERY_CACHE_SIZE.value)
+        # statements are compiled on a connection of their own so
+        # classifying never waits for a pooled connection to be given back
+        self.classifier = self.connect(uri, connect_function)
+        self.classifier_lock = threading.Lock()
+
+    @staticmethod
+    def connect(uri: str, connect_function) -> sqlite3.Connection:
+        conn = connect_function(
+            uri, uri=True, check_same_thread=False,
+            cached_statements=config.Config.CACHED_STATEMENTS.value)
+        conn.row_factory = dict_factory
+        return conn
+
+    def is_read(self, sql_script: str, params=None) -> bool:
+        """
+        Check if a query can be run on a read connection, reads start with
+        a read keyword and compile to a program that never writes, which
+        catches WITH ... INSERT. Results are cached by sql text, a statement
+        that fails to compile goes to the writer to run and report the error
+        and is checked again next time
+        :param sql_script: sql to be checked
+        :param params: parameters of the query
+        :return: boolean indicating if query can be given to a read connection
+        """
+        if not is_read_query(sql_script):
+            return False
+        read = self.read_queries.get(sql_script)
+        if read is None:
+            with self.classifier_lock:
+                read = is_read_only_statement(self.classifier, sql_script,
+                                              () if params is None else params)
+            if read is None:
+                return False
+            self.read_queries.put(sql_script, read)
+        return read
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrow a read connection from the pool, blocking until one is free
+        :return: read only connection
+        """
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def dedicated_connection(self) -> sqlite3.Connection:
+        """
+        Open a read connection outside the pool for a caller holding it
+        while it does other queries, it must be closed by the caller
+        :return: read only connection
+        """
+        return self.connect(self.uri, self.connect_function)
+
+    def close(self) -> None:
+        while not self.connections.empty():
+            self.connections.get().close()
+        self.classifier.close()
+
 class Query:
-    def __init__(self, function: Callable, *args, **kwargs):
+    def __init__(self, function: Callable, *args, durable: bool = False,
+                 **kwargs):
         self.function = function
         self.args = args
         self.kwargs = kwargs
+        # durable queries only return once their transaction is committed
+        self.durable = durable
+        # group commit batch the query left uncommitted writes in
+        self.batch : int | None = None
         self.result = queue.Queue()
-        self.logging_stack = inspect.stack()[2:]
+        self.logging_stack = self.get_logging_stack()
+
+    @staticmethod
+    def get_logging_stack() -> list[Any]:
+        return inspect.stack()[3:]
+
+    def set_result(self, value: Any,
+                   exception: Exception | None = None) -> None:
+        """
+        Hand the outcome of the query back to the thread waiting on it
+        :param value: value returned by the query
+        :param exception: exception raised by the query if it failed
+        :return:
+        """
+        self.result.put((value, exception))
 
     def get_result(self):
-        return self.result.get()
+        value, exception = self.result.get()
+        if exception is not None:
+            raise exception
+        return value
 
 class Database:
     def __init__(self, database: str, init_script: str,
@@ -34,12 +196,32 @@ class Database:
         self.init_script = init_script
         self.database = config.Config.DATABASE_FOLDER.value + os.sep + database
         self.script_directory = script_directory + os.path.sep
+        self.scripts = ScriptRegistry(
+            self.script_directory,
+            config.Config.PRERENDERED_SCRIPT_ARITIES.value)
         self.last_change = time.time()
+        # connection total_changes when last_change was last moved
+        self.total_changes = 0
         self.connect_function = connect_function
 
         # allow connection to be NoneType for initialisation within the daemon
         self.conn : sqlite3.Connection | None = None
 
+        # only created once the writer has initialised the database
+        self.read_pool : ConnectionPool | None = None
+
+        # writes are committed in batches by group_commit_loop when enabled
+        self.group_commit : bool = False
+        # batches committed or rolled back by group_commit_loop, a thread
+        # reads through the writer until the batch of its last write is
+        # finished so it sees its own uncommitted rows, see pending_writes
+        self.finished_batches : int = 0
+        self.thread_writes = threading.local()
+
+        # called on the command thread after a batch is rolled back, rows
+        # inserted by it are gone and their ids will be handed out again
+        self.rollback_listeners : list[Callable[[], None]] = []
+
         self.db_exists = self.database_exists()
 
         if config.Config.THREADED_SERVER_HANDLING.value:
@@ -59,15 +241,46 @@ class Database:
             if config.Config.AUTO_RESET_ON_DB_INIT_CHANGES.value:
                 self.check_hash()
 
+            self.migrate()
+
         # Possibly could be done with an interface hosted to local which queues reset
 
     def database_exists(self) -> bool:
         return os.path.isfile(self.database)
 
+    def shard_for(self, domain: str) -> "Database":
+        """
+        Get the database holding a website's rows, see ShardedDatabase
+        :param domain: website url
+        :return: this database as it is not sharded
+        """
+        return self
+
     def set_connection(self) -> None:
-        self.conn = self.connect_function(self.database)
+        self.conn = self.connect_function(
+            self.database,
+            cached_statements=config.Config.CACHED_STATEMENTS.value)
         self.conn.row_factory = dict_factory
 
+        if config.Config.WRITE_AHEAD_LOGGING.value:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+
+    def set_read_pool(self) -> None:
+        """
+        Open the read connections, readers only see committed data so this
+        is only useful alongside WAL mode where they do not block the writer
+        :return:
+        """
+        if not config.Config.WRITE_AHEAD_LOGGING.value:
+            return
+
+        if not config.Config.READ_CONNECTIONS.value:
+            return
+
+        self.read_pool = ConnectionPool(self.database,
+                                        config.Config.READ_CONNECTIONS.value,
+                                        self.connect_function)
+
     def handle_queries(self):
         self.set_connection()
 
@@ -77,25 +290,188 @@ class Database:
         if config.Config.AUTO_RESET_ON_DB_INIT_CHANGES.value:
             self.check_hash()
 
+        self.migrate()
+
         if config.Config.PRINT_SQL_COMMANDS.value:
             self.conn.set_trace_callback(log.log)
 
+        self.set_read_pool()
+
+        if config.Config.GROUP_COMMIT.value:
+            self.conn.commit()
+            self.group_commit = True
+            self.group_commit_loop()
+            return
+
         while True:
             query = self.command_queue.get()
+            query.set_result(*self.run_query(query))
+
+    def run_query(self, query: Query) -> tuple[Any, Exception | None]:
+        """
+        Run a query on the command thread, exceptions are handed back to the
+        caller rather than stopping the thread
+        :param query: query to be run
+        :return: value returned by the query and the exception raised if any
+        """
+        try:
+            return_value = query.function(*query.args, **query.kwargs)
+
+            if config.Config.PRINT_SQL_COMMANDS.value:
+                log.log(return_value)
+
+            return return_value, None
+
+        except Exception as e:
+            log.log(
+                f"Exception: {e} occured whilst processing "
+                f"{query.logging_stack[0]} with args "
+                f"{query.args} and kwargs {query.kwargs}")
+            return None, e
+
+    def group_commit_loop(self) -> None:
+        """
+        Run queued writes inside a shared transaction which is committed once
+        enough statements have been run or the oldest uncommitted write has
+        waited long enough. Durable queries are answered after the commit,
+        everything else is answered as soon as it has run. A commit that
+        fails rolls the batch back and is raised to its durable queries.
+        :return:
+        """
+        max_statements = config.Config.GROUP_COMMIT_MAX_STATEMENTS.value
+        max_latency = config.Config.GROUP_COMMIT_MAX_LATENCY_MS.value / 1000
+
+        waiting: list[tuple[Query, tuple[Any, Exception | None]]] = []
+        statements = 0
+        batch_start: float | None = None
+
+        while True:
+            timeout = None
+            if batch_start is not None:
+                timeout = max(0.0, batch_start + max_latency - time.time())
+
             try:
-                return_value = query.function(*query.args, **query.kwargs)
+                query = self.command_queue.get(timeout=timeout)
+            except queue.Empty:
+                query = None
+
+            if query is not None:
+                outcome = self.run_query(query)
+                if self.conn.in_transaction:
+                    query.batch = self.finished_batches
+
+                if query.durable:
+                    waiting.append((query, outcome))
+                else:
+                    query.set_result(*outcome)
+
+                if self.conn.in_transaction:
+                    statements += 1
+                    if batch_start is None:
+                        batch_start = time.time()
+
+            # commit early if someone is waiting and nothing else is queued
+            if self.conn.in_transaction and not (
+                    query is None
+                    or statements >= max_statements
+                    or time.time() - batch_start >= max_latency
+                    or (waiting and self.command_queue.empty())):
+                continue
+
+            if self.conn.in_transaction:
+                try:
+                    self.conn.commit()
+                except Exception as e:
+                    # the batch is lost, durable callers are told instead of
+                    # the writer thread stopping
+                    log.log(f"Exception: {e} occured whilst committing "
+                            f"{statements} statements, rolling back")
+                    self.rollback()
+                    waiting = [(waiting_query, (None, e))
+                               for waiting_query, _ in waiting]
+                self.finished_batches += 1
+
+            statements = 0
+            batch_start = None
+
+            for waiting_query, outcome in waiting:
+                waiting_query.set_result(*outcome)
+            waiting.clear()
+
+    def rollback(self) -> None:
+        """
+        Roll back the open transaction on the command thread, logging
+        rather than raising if that fails too
+        :return:
+        """
+        try:
+            self.conn.rollback()
+        except sqlite3.Error as e:
+            log.log(f"Exception: {e} occured whilst rolling back")
+
+        for listener in self.rollback_listeners:
+            listener()
+
+    def note_write(self, query: Query) -> None:
+        """
+        Remember the batch a query from the calling thread left uncommitted
+        writes in, called once the writer has run it
+        :param query: query run by the writer
+        :return:
+        """
+        if query.batch is not None:
+            self.thread_writes.batch = query.batch
+
+    def pending_writes(self) -> bool:
+        """
+        Check if a write from the calling thread may still be uncommitted,
+        read connections cannot see it until its batch is committed
+        :return: boolean indicating if reads must go through the writer
+        """
+        return getattr(self.thread_writes, "batch", -1) >= self.finished_batches
+
+    def note_changes(self) -> None:
+        """
+        Move last_change forward only if rows were modified since it was last
+        moved so reads through the command thread do not count as changes
+        :return:
+        """
+        total_changes = self.conn.total_changes
+        if total_changes != self.total_changes:
+            self.total_changes = total_changes
+            self.last_change = time.time()
+
+    def auto_commit(self) -> None:
+        """
+        Commit after a write unless group commit is handling transactions
+        :return:
+        """
+        if not self.group_commit:
+            self.conn.commit()
 
-                if config.Config.PRINT_SQL_COMMANDS.value:
-                    log.log(return_value)
+    def commit(self) -> None:
+        """
+        Wait until every write queued before this call has been committed
+        :return:
+        """
+        if config.Config.THREADED_SERVER_HANDLING.value:
+            if threading.current_thread() != self.command_thread:
+                query = Query(self.commit, durable=True)
+                self.command_queue.put(query)
+                query.get_result()
+                return
 
-                query.result.put(return_value)
+        if not self.group_commit:
+            self.conn.commit()
 
-            except Exception as e:
-                log.log(
-                    f"Exception: {e} occured whilst processing "
-                    f"{query.logging_stack[0]} with args "
-                    f"{query.args} and kwargs {query.kwargs}")
-                raise
+    def data_version(self) -> int:
+        """
+        Counter sqlite moves whenever another connection, including one in
+        another process, commits to the database. Read through the writer
+        whose connection stays open between calls
+        :return: data version of the writer connection
+        """
+        return self.execute("PRAGMA data_version")[0]["data_version"]
 
     def get_hash(self) -> str:
         with open(self.script_directory + self.init_script, 'rb') as f:
@@ -115,6 +491,47 @@ class Database:
             self.reset_database()
 
 
+    def get_migrations(self) -> list[tuple[int, str]]:
+        """
+        Find migration scripts, each is named with its version number first
+        :return: sorted list of versions and script paths relative to the
+        script directory
+        """
+        folder = config.Config.MIGRATION_FOLDER.value
+        migrations = []
+        for file_name in os.listdir(self.script_directory + folder):
+            if not file_name.endswith(".sql"):
+                continue
+            version = int(file_name.split()[0])
+            migrations.append((version, folder + os.path.sep + file_name))
+        return sorted(migrations)
+
+    def migrate(self) -> None:
+        """
+        Apply every migration newer than the schema version stored in the
+        database, each migration is applied in its own transaction together
+        with the version bump so existing data is kept
+        :return:
+        """
+        version = self.conn.execute(
+            "PRAGMA user_version").fetchone()["user_version"]
+
+        for migration_version, migration in self.get_migrations():
+            if migration_version <= version:
+                continue
+
+            log.log(f"Applying migration {migration}")
+            sql_script = self.scripts.read_script(migration)
+            try:
+                self.conn.executescript(
+                    f"BEGIN;\n{sql_script};\n"
+                    f"PRAGMA user_version = {migration_version};\nCOMMIT;")
+            except sqlite3.Error:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                log.log(f"Migration {migration} failed")
+                raise
+
     def cursor_wrapper(self, func: Callable) -> Callable:
         def wrapper(*args, **kwargs):
             cursor = self.conn.cursor()
@@ -130,6 +547,7 @@ class Database:
                 query = Query(self.execute_script, script, params=params)
                 self.command_queue.put(query)
                 _ = query.get_result()
+                self.note_write(query)
                 del query
                 return
 
@@ -150,19 +568,35 @@ class Database:
             log.log(sql_script)
             raise
 
-        self.last_change = time.time()
+        self.note_changes()
 
-        self.conn.commit()
+        self.auto_commit()
 
     def execute(self, script: str,
                 params=None, is_file=False) -> list[dict[str, Any]]:
-
+        """
+        Run a single statement. With threaded server handling reads run on
+        the read connections unless the calling thread has writes still
+        waiting on a group commit, those reads go through the writer so a
+        thread always reads back its own writes. Writes from other threads
+        are only seen once committed
+        :param script: sql or script file name
+        :param params: parameters for the query
+        :param is_file: whether script is a file name
+        :return: rows returned by the query
+        """
         if config.Config.THREADED_SERVER_HANDLING.value:
             if threading.current_thread() != self.command_thread:
+                if self.read_pool is not None and not self.pending_writes():
+                    sql_script = self.get_script(script) if is_file else script
+                    if self.read_pool.is_read(sql_script, params):
+                        return self.execute_read(sql_script, params)
+
                 query = Query(self.execute, script,
                               params=params, is_file=is_file)
                 self.command_queue.put(query)
                 result = query.get_result()
+                self.note_write(query)
                 del query
                 return result
 
@@ -175,18 +609,170 @@ class Database:
         cursor = self.conn.cursor()
         cursor.execute(sql_script, params)
         return_value = cursor.fetchall()
-        self.last_change = time.time()
-        self.conn.commit()
+        self.note_changes()
+        self.auto_commit()
         return return_value
 
+    def transaction(self, function: Callable, *args, **kwargs) -> Any:
+        """
+        Run a function against a cursor on the command thread as one
+        transaction, the whole function is a single queue round trip
+        :param function: called with a cursor followed by any other arguments
+        :return: value returned by the function
+        """
+        if config.Config.THREADED_SERVER_HANDLING.value:
+            if threading.current_thread() != self.command_thread:
+                query = Query(self.transaction, function, *args,
+                              durable=True, **kwargs)
+                self.command_queue.put(query)
+                result = query.get_result()
+                del query
+                return result
+
+        cursor = self.conn.cursor()
+
+        # a savepoint keeps a failed function from rolling back other writes
+        # sharing a group commit
+        if not self.conn.in_transaction:
+            cursor.execute("BEGIN")
+        cursor.execute("SAVEPOINT function_transaction")
+        try:
+            return_value = function(cursor, *args, **kwargs)
+        except Exception:
+            cursor.execute("ROLLBACK TO function_transaction")
+            cursor.execute("RELEASE function_transaction")
+            raise
+        cursor.execute("RELEASE function_transaction")
+
+        self.note_changes()
+        self.auto_commit()
+        return return_value
+
+    def execute_read(self, sql_script: str,
+                     params=None) -> list[dict[str, Any]]:
+        """
+        Run a SELECT on a pooled read connection in the calling thread
+        bypassing the writer queue
+        :param sql_script: sql to be run
+        :param params: parameters for the query
+        :return: rows returned by the query
+        """
+        if params is None:
+            params = ()
+
+        with self.read_pool.connection() as conn:
+            return conn.execute(sql_script, params).fetchall()
+
+    def iterate(self, script: str, params=None, is_file=False,
+                batch_size: int | None = None,
+                row_factory: str = "tuple") -> Generator[Any, None, None]:
+        """
+        Stream the rows of a query in batches so memory stays bounded however
+        large the result is. Reads use a read connection of their own rather
+        than a pooled one so the caller can run other queries whilst
+        consuming the rows, otherwise each batch is one round trip to the
+        command thread.
+        :param script: sql or script file name
+        :param params: parameters for the query
+        :param is_file: whether script is a file name
+        :param batch_size: rows fetched at a time
+        :param row_factory: one of ROW_FACTORIES
+        :return: generator of rows
+        """
+        if batch_size is None:
+            batch_size = config.Config.ITERATE_BATCH_SIZE.value
+        if params is None:
+            params = ()
+
+        sql_script = self.get_script(script) if is_file else script
+        factory = ROW_FACTORIES[row_factory]
+
+        on_command_thread = (not config.Config.THREADED_SERVER_HANDLING.value
+                             or threading.current_thread() == self.command_thread)
+
+        if not on_command_thread and self.read_pool is not None \
+                and not self.pending_writes() \
+                and self.read_pool.is_read(sql_script, params):
+            conn = self.read_pool.dedicated_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.row_factory = factory
+                cursor.execute(sql_script, params)
+                while rows := cursor.fetchmany(batch_size):
+                    yield from rows
+            finally:
+                conn.close()
+            return
+
+        cursor = self.open_cursor(sql_script, params, factory)
+        try:
+            while rows := self.fetch_batch(cursor, batch_size):
+                yield from rows
+        finally:
+            self.close_cursor(cursor)
+
+    def open_cursor(self, sql_script: str, params,
+                    row_factory: Callable | None) -> sqlite3.Cursor:
+        """
+        Execute a query on the command thread leaving its rows to be fetched
+        :return: cursor to be given to fetch_batch
+        """
+        if config.Config.THREADED_SERVER_HANDLING.value:
+            if threading.current_thread() != self.command_thread:
+                query = Query(self.open_cursor, sql_script, params, row_factory)
+                self.command_queue.put(query)
+                return query.get_result()
+
+        cursor = self.conn.cursor()
+        cursor.row_factory = row_factory
+        cursor.execute(sql_script, params)
+        return cursor
+
+    def fetch_batch(self, cursor: sqlite3.Cursor,
+                    batch_size: int) -> list[Any]:
+        if config.Config.THREADED_SERVER_HANDLING.value:
+            if threading.current_thread() != self.command_thread:
+                query = Query(self.fetch_batch, cursor, batch_size)
+                self.command_queue.put(query)
+                return query.get_result()
+
+        return cursor.fetchmany(batch_size)
+
+    def close_cursor(self, cursor: sqlite3.Cursor) -> None:
+        if config.Config.THREADED_SERVER_HANDLING.value:
+            if threading.current_thread() != self.command_thread:
+                query = Query(self.close_cursor, cursor)
+                self.command_queue.put(query)
+                query.get_result()
+                return
+
+        cursor.close()
+
     def reset_database(self):
+        self.drop_tables()
         self.execute_script(self.init_script)
+        # tables are recreated from scratch so every migration is reapplied
+        self.execute("PRAGMA user_version = 0")
         self.execute_script(config.Config.HASH_SCRIPT.value)
         self.execute(
             config.Config.HASH_INSERT.value,
             params=(self.get_hash(),), is_file=True
         )
 
+    def drop_tables(self) -> None:
+        """
+        Drop every table, tables added by migrations or created on demand are
+        not dropped by the init script and would otherwise survive a reset
+        :return:
+        """
+        # virtual tables first as dropping them drops their shadow tables
+        tables = self.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY sql LIKE 'CREATE VIRTUAL TABLE%' DESC")
+        for table in tables:
+            self.execute(f'DROP TABLE IF EXISTS "{table["name"]}"')
+
     def execute_many(self,
             script: str,
             params: Iterable[Iterable[str]] |
@@ -198,6 +784,7 @@ class Database:
                               params=params)
                 self.command_queue.put(query)
                 result = query.get_result()
+                self.note_write(query)
                 del query
                 return result
 
@@ -209,19 +796,140 @@ class Database:
         cursor = self.conn.cursor()
         cursor.executemany(sql_script, params)
         return_value = cursor.fetchall()
-        self.last_change = time.time()
-        self.conn.commit()
+        self.note_changes()
+        self.auto_commit()
         return return_value
 
 
     def get_script(self, script: str) -> str:
-        with open(self.script_directory + script, 'r') as f:
-            return f.read()
+        return self.scripts.get(script)
+
+    def render_script(self, script: str, **arities: int) -> str:
+        """
+        Get a templated script expanded for the given number of parameters
+        :param script: script file name
+        :param arities: number of items for each placeholder in the script
+        :return: sql text
+        """
+        return self.scripts.render(script, **arities)
+
+    def reload_scripts(self) -> None:
+        """
+        Reload all sql scripts from disk, for use whilst developing scripts
+        :return:
+        """
+        self.scripts.reload()
 
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.read_pool is not None:
+            self.read_pool.close()
         self.conn.close()
 
+class ShardedDatabase:
+    """
+    Partitions the crawl across several database files by website, each
+    shard has its own writer thread. A page, its tokens and the links found
+    on it are stored in the shard of the page's website so reads about one
+    website use shard_for while every other read is run on all shards and
+    the rows are concatenated.
+    """
+    def __init__(self, database: str, init_script: str, shard_count: int,
+                 script_directory: str = "",
+                 connect_function = sqlite3.connect) -> None:
+        name, extension = os.path.splitext(database)
+        self.shards: list[Database] = [
+            Database(f"{name}_{i}{extension}", init_script,
+                     script_directory=script_directory,
+                     connect_function=connect_function)
+            for i in range(shard_count)]
+        self.fan_out = concurrent.futures.ThreadPoolExecutor(
+            max_workers=shard_count, thread_name_prefix="shard_fan_out")
+
+    @property
+    def last_change(self) -> float:
+        return max(shard.last_change for shard in self.shards)
+
+    def data_version(self) -> int:
+        # every shard's version only goes up so the sum moves with any
+        return sum(self.map_shards(lambda shard: shard.data_version()))
+
+    def shard_for(self, domain: str) -> Database:
+        """
+        Get the shard holding a website's rows, crc32 is used rather than
+        hash so the mapping is the same between runs
+        :param domain: website url
+        :return: shard database
+        """
+        return self.shards[zlib.crc32(domain.encode()) % len(self.shards)]
+
+    def map_shards(self, function: Callable[[Database], Any]) -> list[Any]:
+        """
+        Run a function against every shard in parallel
+        :param function: called with each shard
+        :return: results in shard order
+        """
+        return list(self.fan_out.map(function, self.shards))
+
+    def execute(self, script: str,
+                params=None, is_file=False) -> list[dict[str, Any]]:
+        results = self.map_shards(
+            lambda shard: shard.execute(script, params=params, is_file=is_file))
+        return list(itertools.chain.from_iterable(results))
+
+    def execute_many(self,
+            script: str,
+            params: Iterable[Iterable[str]] |
+                    Iterable[dict[str, str]] |
+                    None = None) -> list[dict[str, Any]]:
+        # every shard needs its own pass over the parameters
+        if params is not None:
+            params = list(params)
+        results = self.map_shards(
+            lambda shard: shard.execute_many(script, params=params))
+        return list(itertools.chain.from_iterable(results))
+
+    def execute_script(self, script: str,
+                       params: dict[str, str] | Iterable[str] | None = None) -> None:
+        self.map_shards(lambda shard: shard.execute_script(script, params=params))
+
+    def iterate(self, script: str, params=None, is_file=False,
+                batch_size: int | None = None,
+                row_factory: str = "tuple") -> Generator[Any, None, None]:
+        for shard in self.shards:
+            yield from shard.iterate(script, params=params, is_file=is_file,
+                                     batch_size=batch_size,
+                                     row_factory=row_factory)
+
+    def commit(self) -> None:
+        self.map_shards(lambda shard: shard.commit())
+
+    def get_script(self, script: str) -> str:
+        return self.shards[0].get_script(script)
+
+    def render_script(self, script: str, **arities: int) -> str:
+        return self.shards[0].render_script(script, **arities)
+
+    def reload_scripts(self) -> None:
+        for shard in self.shards:
+            shard.reload_scripts()
+
+
+def open_database() -> Database | ShardedDatabase:
+    """
+    Open the database described by the config
+    :return: a single database or a sharded one if more than one shard is set
+    """
+    if config.Config.DATABASE_SHARDS.value > 1:
+        return ShardedDatabase(config.Config.DATABASE_NAME.value,
+                               config.Config.INIT_SCRIPT.value,
+                               config.Config.DATABASE_SHARDS.value,
+                               script_directory=config.Config.SCRIPT_FOLDER.value)
+
+    return Database(config.Config.DATABASE_NAME.value,
+                    config.Config.INIT_SCRIPT.value,
+                    script_directory=config.Config.SCRIPT_FOLDER.value)
+
 if __name__ == '__main__':
     # Testing
     db = Database("testing.db", "webdbinit.sql")